@@ -19,7 +19,8 @@ import logging
 import warnings
 import asyncio
 import uuid
-from typing import List, Union
+import queue
+from typing import Callable, List, Optional, Union
 from PIL import Image
 from src.client import MCPClient
 from src.server.snowrag.vectorstores import SnowflakeVectorStore
@@ -135,8 +136,13 @@ except Exception as e:
 
 
 # Function to call the MCP tool
-def call_mcp_tool_image_recognition(tool_input: Union[str, bytes]) -> tuple[str, bytes]:
-    """Sending input to MCP via the SSE-backed session and return the description and raw image bytes."""
+def call_mcp_tool_image_recognition(
+    tool_input: Union[str, bytes],
+    on_token: Optional[Callable[[str], None]] = None
+) -> tuple[str, bytes]:
+    """Sending input to MCP via the SSE-backed session and return the description and raw image bytes.
+       If `on_token` is given, the description is streamed and `on_token` is called with the
+       text received so far whenever a new fragment arrives."""
 
     # Accepting only image data here
     if isinstance(tool_input, str):
@@ -147,28 +153,45 @@ def call_mcp_tool_image_recognition(tool_input: Union[str, bytes]) -> tuple[str,
         payload = base64.b64encode(tool_input).decode("utf-8")
     else:
         payload = tool_input
+
+    # Collecting streamed fragments from the MCP loop thread for the Streamlit thread
+    fragments = queue.Queue()
+    async def _on_progress(progress, total, message):
+        if message:
+            fragments.put(message)
+
     async def _invoke():
         print(f"Calling MCP tool with input...")
 
         # Using correct parameter name matching server-side image_recognition signature
         result = await _mcp_client.session.call_tool(
-            "image_recognition", {"image_bytes": payload}
+            "image_recognition",
+            {"image_bytes": payload, "stream": on_token is not None},
+            progress_callback=_on_progress if on_token is not None else None
         )
         print(f"Received MCP tool result!")
         return result
 
-    # Scheduling invocation on persistent loop
-    execution = asyncio.run_coroutine_threadsafe(_invoke(), _mcp_loop).result()
-
-    # Extracting JSON text from the first TextContent in the response
-    content = execution.content
-    text_obj = content[0]
-    json_str = getattr(text_obj, 'text', text_obj)
-    parsed = json.loads(json_str)
-    description = parsed.get('description', '')
-    image_bytes_b64 = parsed.get('image_bytes', '')
-    raw = base64.b64decode(image_bytes_b64) if isinstance(
-        image_bytes_b64, str) else image_bytes_b64
+    # Scheduling invocation on persistent loop and rendering fragments while waiting
+    future = asyncio.run_coroutine_threadsafe(_invoke(), _mcp_loop)
+    streamed = ""
+    while on_token is not None and not future.done():
+        try:
+            streamed += fragments.get(timeout=0.05)
+            on_token(streamed)
+        except queue.Empty:
+            pass
+    execution = future.result()
+
+    # Extracting the description and thumbnail from the text and image content blocks
+    if execution.isError:
+        raise RuntimeError(getattr(execution.content[0], 'text', 'MCP image_recognition tool failed.'))
+    description, raw = "", b""
+    for block in execution.content:
+        if block.type == "text" and not description:
+            description = block.text
+        elif block.type == "image" and not raw:
+            raw = base64.b64decode(block.data)
     return description, raw
 
 
@@ -293,12 +316,14 @@ if func_choice == "🌍 Country code Lookup":
     if not st.session_state["IS_EMBED"]:
         st.title("🌍 Country code Lookup")
     with st.form("country_code_form"):
-        country_code = st.text_input("Country Code")
+        country_input = st.text_area("Country Code", help="One code, or many codes separated by commas or new lines, e.g. a pasted spreadsheet column.")
         submitted = st.form_submit_button("Lookup Country Code")
     if submitted:
-        if not country_code:
+        country_codes = [code.strip() for code in country_input.replace(",", "\n").replace(";", "\n").splitlines() if code.strip()]
+        if not country_codes:
             st.warning("Please enter a country code.")
-        else:
+        elif len(country_codes) == 1:
+            country_code = country_codes[0]
             with st.spinner("Looking up country code via MCP..."):
                 async def _invoke():
                     result = await _mcp_client.session.call_tool(
@@ -318,6 +343,32 @@ if func_choice == "🌍 Country code Lookup":
                         st.warning(f"Kein Ländername für den Ländercode '{country_code}' gefunden.")
                 except Exception as e:
                     st.error(f"Lookup failed: {e}")
+        else:
+            with st.spinner(f"Looking up {len(country_codes)} country codes via MCP..."):
+                # Resolving all codes with a single tool call
+                async def _invoke():
+                    result = await _mcp_client.session.call_tool(
+                        "get_country_names",
+                        {"country_codes": country_codes}
+                    )
+                    return result
+                try:
+                    execution = asyncio.run_coroutine_threadsafe(_invoke(), _mcp_loop).result()
+                    if execution.isError:
+                        raise Exception(getattr(execution.content[0], 'text', execution.content[0]))
+                    lookup = json.loads(execution.content[0].text)
+                    st.dataframe([
+                        {
+                            "Ländercode": code,
+                            "Ländername": lookup["names"].get(code, ""),
+                            "Fehler": lookup["errors"].get(code, ""),
+                        }
+                        for code in dict.fromkeys(country_codes)
+                    ], use_container_width=True)
+                    if lookup["errors"]:
+                        st.warning(f"{len(lookup['errors'])} von {len(set(country_codes))} Ländercodes nicht gefunden.")
+                except Exception as e:
+                    st.error(f"Lookup failed: {e}")
 
 elif func_choice == "🌌 Static Image":
     if not st.session_state["IS_EMBED"]:
@@ -372,9 +423,13 @@ elif func_choice == "🩻 Image Recognition":
     )
     if uploaded:
         img_bytes = uploaded.read()
+        description_placeholder = st.empty()
         with st.spinner("Waiting for MCP tool response..."):
-            description, raw_bytes = call_mcp_tool_image_recognition(img_bytes)
-        st.write(f"**Beschreibung:** {description}")
+            description, raw_bytes = call_mcp_tool_image_recognition(
+                img_bytes,
+                on_token=lambda text: description_placeholder.write(f"**Beschreibung:** {text}")
+            )
+        description_placeholder.write(f"**Beschreibung:** {description}")
         thumb = Image.open(io.BytesIO(raw_bytes))
         st.image(thumb, caption="Thumbnail", use_container_width=True)
 
@@ -542,7 +597,7 @@ elif func_choice == "❄️ Navigator":
             try:
                 options_offline_resources = list_buckets(minio_client)
             except Exception as e:
-                st.warning(f"Fehler beim Laden der MinIO Buckets: {e}")
+                st.error(f"Fehler beim Laden der MinIO Buckets: {e}")
                 options_offline_resources = []
 
             # Creating a mapping from display name to bucket name
@@ -597,7 +652,11 @@ elif func_choice == "❄️ Navigator":
 
                                 # Listing objects in the selected MinIO bucket
                                 st.markdown("**Dokumente**")
-                                object_names = list_objects(self.minio_client, self.bucket_name)
+                                try:
+                                    object_names = list_objects(self.minio_client, self.bucket_name)
+                                except Exception as e:
+                                    st.error(f"Fehler beim Laden der Dateien aus dem MinIO-Bucket: {e}")
+                                    return documents
                                 if not object_names:
                                     st.warning("Keine Dateien im MinIO-Bucket gefunden.")
                                     return documents
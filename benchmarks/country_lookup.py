@@ -0,0 +1,122 @@
+### `benchmarks/country_lookup.py`
+### Benchmark of per-call connections versus the pooled MySQL access of get_country_name
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Setting the source directory, so the server package can be imported
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Setting the sample rows created by `--setup`
+COUNTRIES = [
+    ("DE", "Deutschland"), ("AT", "Österreich"), ("CH", "Schweiz"), ("FR", "Frankreich"),
+    ("IT", "Italien"), ("ES", "Spanien"), ("GB", "Vereinigtes Königreich"), ("US", "Vereinigte Staaten"),
+    ("MW", "Malawi"), ("ZA", "Südafrika"),
+]
+QUERY = "SELECT `ShortName de` FROM stage$iso3166 WHERE CODE = %s;"
+
+
+def _connection_args(args) -> dict:
+    return {
+        "host": args.host, "port": args.port, "user": args.user,
+        "password": args.password, "database": args.database,
+    }
+
+
+def _setup(args) -> None:
+    """Creating the `stage$iso3166` table with sample rows in the benchmark database."""
+    import mysql.connector
+    conn = mysql.connector.connect(**_connection_args(args))
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS stage$iso3166 "
+                   "(CODE CHAR(2) PRIMARY KEY, `ShortName de` VARCHAR(100))")
+    cursor.executemany("REPLACE INTO stage$iso3166 VALUES (%s, %s)", COUNTRIES)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"Created stage$iso3166 with {len(COUNTRIES)} rows.")
+
+
+async def _connect_per_call(args, code: str) -> str:
+    """Connecting and querying synchronously inside the coroutine (the previous behaviour)."""
+    import mysql.connector
+    conn = mysql.connector.connect(**_connection_args(args))
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(QUERY, (code,))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return rows[0]["ShortName de"]
+
+
+async def _run(mode: str, args) -> list[float]:
+    """Running `--calls` lookups with `--concurrency` concurrent callers and returning their latencies."""
+    from server.database import database
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def lookup(index: int) -> None:
+        code = COUNTRIES[index % len(COUNTRIES)][0]
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "connect":
+                await _connect_per_call(args, code)
+            else:
+                rows = await database.query(QUERY, (code,))
+                assert rows
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    # Warming up the pool outside of the measurement
+    if mode == "pooled":
+        await asyncio.gather(*(database.query(QUERY, ("DE",)) for _ in range(args.concurrency)))
+    await asyncio.gather(*(lookup(index) for index in range(args.calls)))
+    if mode == "pooled":
+        database.close()
+    return latencies
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark country lookups against MySQL")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="benbox")
+    parser.add_argument("--database", default="benbox")
+    parser.add_argument("--calls", type=int, default=2000, help="Lookups per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent callers")
+    parser.add_argument("--pool-size", type=int, default=5, help="Connections of the pool")
+    parser.add_argument("--setup", action="store_true", help="Create the sample table first")
+    args = parser.parse_args()
+
+    # Configuring the server package through its environment overrides before importing it
+    os.environ.update({
+        "DB_HOST": args.host, "DB_PORT": str(args.port), "DB_USER": args.user,
+        "DB_PASSWORD": args.password, "DB_NAME": args.database, "DB_POOL_SIZE": str(args.pool_size),
+    })
+    sys.path.insert(0, SRC_PATH)
+    if args.setup:
+        _setup(args)
+
+    print(f"{'mode':<10}{'calls/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for mode in ("connect", "pooled"):
+        start = time.perf_counter()
+        latencies = asyncio.run(_run(mode, args))
+        elapsed = time.perf_counter() - start
+        print(f"{mode:<10}{len(latencies) / elapsed:>10.0f}{statistics.median(latencies):>10.2f}"
+              f"{_percentile(latencies, 99):>10.2f}{max(latencies):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+### `benchmarks/thumbnail_decode.py`
+### Benchmark of full versus reduced-resolution decoding for thumbnails
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import argparse
+import importlib.util
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from pathlib import Path
+from PIL import Image as PILImage
+
+# Setting the path of the imaging module, loaded standalone to keep the server package out of the RSS
+IMAGING_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "src", "server", "imaging.py"))
+
+
+def _make_jpeg(megapixels: float) -> bytes:
+    """Creating a photo-like test JPEG with roughly the requested number of megapixels."""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    gradient = PILImage.linear_gradient("L").resize((width, height))
+    noise = PILImage.effect_noise((width, height), 4)
+    img = PILImage.merge("RGB", (gradient, noise, gradient.transpose(PILImage.Transpose.ROTATE_180)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _full_decode(image_bytes: bytes, size: tuple[int, int]) -> bytes:
+    """Decoding at full resolution before thumbnailing (the previous behaviour)."""
+    img = PILImage.open(io.BytesIO(image_bytes))
+    img.load()
+    img.thumbnail(size)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _peak_rss_kib() -> int:
+    """Returning the peak RSS of this process in KiB (VmHWM on Linux, ru_maxrss elsewhere)."""
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(mode: str, image_bytes: bytes, size: tuple[int, int], queue) -> None:
+    """Running one decode in a fresh process and reporting wall time and peak RSS growth."""
+    spec = importlib.util.spec_from_file_location("imaging", IMAGING_PATH)
+    imaging = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(imaging)
+    fn = imaging.create_thumbnail if mode == "reduced" else _full_decode
+    baseline = _peak_rss_kib()
+    start = time.perf_counter()
+    fn(image_bytes, size)
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_kib()
+    queue.put((elapsed, (peak - baseline) / 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark thumbnail decoding")
+    parser.add_argument("images", nargs="*", help="JPEG files, a synthetic image is used if omitted")
+    parser.add_argument("--megapixels", type=float, default=24.0, help="Size of the synthetic image")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per mode and image")
+    parser.add_argument("--size", type=int, default=400, help="Thumbnail edge length")
+    args = parser.parse_args()
+
+    # Loading the benchmark images
+    if args.images:
+        inputs = [(path, Path(path).read_bytes()) for path in args.images]
+    else:
+        inputs = [(f"synthetic {args.megapixels:g} MP", _make_jpeg(args.megapixels))]
+
+    context = multiprocessing.get_context("spawn")
+    size = (args.size, args.size)
+    print(f"{'image':<28}{'mode':<10}{'median ms':>12}{'peak RSS MiB':>15}")
+    for name, image_bytes in inputs:
+        for mode in ("full", "reduced"):
+            times, peaks = [], []
+            for _ in range(args.repeat):
+                queue = context.Queue()
+                process = context.Process(target=_measure, args=(mode, image_bytes, size, queue))
+                process.start()
+                elapsed, peak = queue.get()
+                process.join()
+                times.append(elapsed * 1000)
+                peaks.append(peak)
+            print(f"{name[:27]:<28}{mode:<10}{statistics.median(times):>12.1f}{max(peaks):>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
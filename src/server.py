@@ -2,65 +2,77 @@
 ### MCP server
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
+import time
+
+# Measuring the import time of the server for `--profile-imports`
+_import_start = time.perf_counter()
 import uvicorn
-import asyncio
-import streamlit as st
-import ast
-from starlette.applications import Starlette
-from mcp.server.sse import SseServerTransport
-from starlette.requests import Request
-from starlette.routing import Mount, Route
-from mcp.server import Server
+import os
 from server import mcp
-from starlette.staticfiles import StaticFiles
-
-# Choosing between Ollama (local) and OpenAI API
-ollama = ast.literal_eval(f"{st.secrets['LLM_LOCAL']}")
+from server.asgi import TRANSPORTS, create_starlette_app
+from server.config import secrets
+startup_import_seconds = time.perf_counter() - _import_start
 
 # Defining a User-Agent header constant
 USER_AGENT = "BenBox/0.3.0"
 
 
-# Setting up the FastMCP server with capabilities
-def create_starlette_app(mcp_server: Server, *, debug: bool = False) -> Starlette:
-    """Creating a Starlette application that can server the provided mcp server with SSE."""
-
-    sse = SseServerTransport("/messages/")
-    async def handle_sse(request: Request) -> None:
-        async with sse.connect_sse(
-                request.scope,
-                request.receive,
-                request._send,  # noqa: SLF001
-        ) as (read_stream, write_stream):
-            try:
-                await mcp_server.run(
-                    read_stream,
-                    write_stream,
-                    mcp_server.create_initialization_options(),
-                )
-            except asyncio.CancelledError:
-                # Exiting gracefully when client disconnects
-                return
-
-    return Starlette(
-        debug=debug,
-        routes=[
-            Route("/sse", endpoint=handle_sse),
-            Mount("/messages/", app=sse.handle_post_message),
-            Mount("/", app=StaticFiles(directory="static", html=True), name="static"),
-        ],
-    )
+# Reporting the import cost saved at startup by loading tool modules lazily
+def profile_imports() -> None:
+    """Printing the startup import time and the import time of every lazily loaded tool module."""
+    from server.lazy_tools import LAZY_MODULES, import_seconds, import_tool_module
+    print(f"Startup imports: {startup_import_seconds:.3f}s")
+    for module in LAZY_MODULES:
+        import_tool_module(module)
+        print(f"  {module}: {import_seconds[module]:.3f}s (deferred to first call)")
+    print(f"Startup time saved: {sum(import_seconds[module] for module in LAZY_MODULES):.3f}s")
 
 
 if __name__ == "__main__":
     mcp_server = mcp._mcp_server
     import argparse
-    parser = argparse.ArgumentParser(description='Run MCP SSE-based server')
+    parser = argparse.ArgumentParser(description='Run MCP server over SSE and streamable HTTP')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8080,
                         help='Port to listen on')
+    parser.add_argument('--transport', choices=TRANSPORTS, default=None,
+                        help='Serving SSE (`/sse`), streamable HTTP (`/mcp`) or both')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of uvicorn worker processes, requires `--transport http` above 1')
+    parser.add_argument('--stateful-http', action='store_true',
+                        help='Keeping streamable HTTP sessions, which then need session affinity')
+    parser.add_argument('--json-response', action='store_true',
+                        help='Answering streamable HTTP requests with JSON instead of an SSE stream')
+    parser.add_argument('--profile-imports', action='store_true',
+                        help='Report the import time of the lazily loaded tool modules and exit')
     args = parser.parse_args()
+    if args.profile_imports:
+        profile_imports()
+        raise SystemExit(0)
+
+    mcp_secrets = secrets.get("MCP", {})
+    transport = args.transport or mcp_secrets.get("MCP_TRANSPORT", "http" if args.workers > 1 else "both")
+    if args.workers > 1 and (transport != "http" or args.stateful_http):
+        # Refusing session-bound transports, as uvicorn workers share one socket without affinity
+        parser.error("--workers above 1 needs the stateless `--transport http`; "
+                     "serve SSE or stateful sessions from a single worker or behind a sticky load balancer")
 
-    # Binding SSE request handling to MCP server
-    starlette_app = create_starlette_app(mcp_server, debug=True)
-    uvicorn.run(starlette_app, host=args.host, port=args.port)
+    if args.workers == 1:
+        # Binding SSE and streamable HTTP request handling to MCP server
+        starlette_app = create_starlette_app(
+            mcp_server,
+            debug=True,
+            transport=transport,
+            stateless=not args.stateful_http,
+            json_response=args.json_response,
+        )
+        uvicorn.run(starlette_app, host=args.host, port=args.port)
+    else:
+        # Passing the settings through the environment inherited by every worker process
+        os.environ["MCP_TRANSPORT"] = transport
+        os.environ["MCP_JSON_RESPONSE"] = str(args.json_response)
+        if "MCP_PROCESS_WORKERS" not in mcp_secrets:
+            # Sharing the cores between the process pools of all workers
+            os.environ["MCP_PROCESS_WORKERS"] = str(max(1, (os.cpu_count() or 1) // args.workers))
+        uvicorn.run("server.asgi:create_app", factory=True, host=args.host, port=args.port,
+                    workers=args.workers)
@@ -2,11 +2,14 @@
 ### MCP server package
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
+import json
 from mcp.server.fastmcp import FastMCP
 
 # Initializing FastMCP server with prompt capabilities (SSE)
 mcp = FastMCP(
     "BenBox",
+    # Lazily loaded tool modules register their tools again on import
+    warn_on_duplicate_tools=False,
     capabilities={
         "resources": {
             "subscribe": True,
@@ -18,10 +21,69 @@ mcp = FastMCP(
         }
 )
 
-# Importing all tool modules to ensure MCP tool registration
+# Importing the lightweight modules to ensure MCP resource and prompt registration
 from . import get_static_image
 from . import get_variable_image
 from . import review_code
-from . import image_recognition
-from . import get_country_name
 from . import rag_on_snow
+
+# Registering the tools of heavy modules from the manifest, importing each module on its first call
+from .lazy_tools import register_lazy_tools
+register_lazy_tools(mcp)
+
+# Limiting concurrent calls per tool, rejecting calls as busy when the wait queue is full
+from .admission import limit_tools
+tool_limiters = limit_tools(mcp)
+
+# Coalescing identical concurrent tool calls into a single backend call
+from .coalesce import coalesce_tools
+tool_flights = coalesce_tools(mcp)
+
+
+@mcp.resource(uri="stats://image_recognition", name="get_image_recognition_stats", description="This offers the statistics of the image recognition caches.", mime_type="application/json")
+def get_image_recognition_stats() -> str:
+    """Image recognition statistics."""
+    from .image_recognition import recognition_stats
+    return json.dumps(recognition_stats())
+
+
+@mcp.resource(uri="stats://coalescing", name="get_coalescing_stats", description="This offers the statistics of coalesced tool calls.", mime_type="application/json")
+def get_coalescing_stats() -> str:
+    """Coalescing statistics per tool."""
+    return json.dumps({name: flight.stats() for name, flight in tool_flights.items()})
+
+
+@mcp.resource(uri="stats://assets", name="get_asset_stats", description="This offers the statistics of the image asset cache.", mime_type="application/json")
+def get_asset_stats() -> str:
+    """Image asset cache statistics."""
+    from .assets import assets
+    return json.dumps(assets.stats())
+
+
+@mcp.resource(uri="stats://subscriptions", name="get_subscription_stats", description="This offers the statistics of resource subscriptions and change notifications.", mime_type="application/json")
+def get_subscription_stats() -> str:
+    """Resource subscription statistics."""
+    return json.dumps(resource_notifier.stats())
+
+
+@mcp.resource(uri="stats://database", name="get_database_stats", description="This offers the statistics of the MySQL connection pool.", mime_type="application/json")
+def get_database_stats() -> str:
+    """MySQL connection pool statistics."""
+    from .database import database
+    return json.dumps(database.stats())
+
+
+@mcp.resource(uri="stats://countries", name="get_country_table_stats", description="This offers the statistics of the in-memory country table.", mime_type="application/json")
+def get_country_table_stats() -> str:
+    """In-memory country table statistics."""
+    from .countries import countries
+    return json.dumps(countries.stats())
+
+
+# Pushing resource change notifications to subscribed sessions
+from .subscriptions import enable_subscriptions
+resource_notifier = enable_subscriptions(mcp)
+
+# Instrumenting every tool, resource and prompt handler for the `/metrics` route
+from .metrics import instrument_handlers
+instrument_handlers(mcp)
@@ -0,0 +1,134 @@
+### `src/server/admission.py`
+### Per-tool admission control with bounded wait queues for MCP server tools
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from typing import Any, AsyncIterator, Optional
+from .config import secrets
+from .metrics import Metrics, metrics
+logger = logging.getLogger(__name__)
+
+# Setting the defaults for tools without their own limits
+TOOL_CONCURRENCY = 8
+TOOL_QUEUE = 32
+TOOL_QUEUE_TIMEOUT = 30.0
+
+
+# Creating the `ServerBusyError` class
+class ServerBusyError(Exception):
+    """Raised when a tool call is rejected because its wait queue is full or it waited too long."""
+
+
+# Creating the `AdmissionLimiter` class
+class AdmissionLimiter:
+    """Limiting the concurrent calls of one tool and bounding the calls waiting for a slot.
+
+    A call beyond `max_concurrency` waits in the queue. When `max_queue` calls are
+    already waiting, or a call has waited `timeout` seconds, it is rejected with
+    `ServerBusyError` right away instead of adding to the latency of all others.
+    The `kind` labels its queue metrics, e.g. `backend` for a limiter shared by
+    all callers of a backend rather than guarding one tool.
+
+    Example:
+        .. code-block:: python
+
+            limiter = AdmissionLimiter("image_recognition", max_concurrency=4, max_queue=16)
+            async with limiter.slot():
+                ...
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        timeout: Optional[float] = None,
+        registry: Optional[Metrics] = None,
+        kind: str = "tool"
+    ):
+        self.name = name
+        self.kind = kind
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._registry = registry or metrics
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+
+    def _reject(self, reason: str) -> ServerBusyError:
+        self._registry.reject(self.kind, self.name)
+        logger.warning(f"Rejected call of {self.name}: {reason}.")
+        return ServerBusyError(f"Server busy: {self.name} {reason}, retry later.")
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Waiting for a free slot in the bounded queue and holding it for the call."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise self._reject(f"has {self.waiting} calls waiting")
+
+        self.waiting += 1
+        self._registry.queue_enter(self.kind, self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(f"had no free slot within {self.timeout:g}s") from None
+        finally:
+            self.waiting -= 1
+            self._registry.queue_exit(self.kind, self.name, time.perf_counter() - start)
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+
+def tool_limits(name: str) -> tuple[int, int, float]:
+    """Reading the concurrency, queue length and queue timeout of a tool from the MCP secrets.
+
+    Tool specific keys like `MCP_CONCURRENCY_IMAGE_RECOGNITION` override the defaults.
+    """
+    mcp_secrets = secrets.get("MCP", {})
+    suffix = name.upper()
+    return (
+        int(mcp_secrets.get(f"MCP_CONCURRENCY_{suffix}",
+                            mcp_secrets.get("MCP_TOOL_CONCURRENCY", TOOL_CONCURRENCY))),
+        int(mcp_secrets.get(f"MCP_QUEUE_{suffix}",
+                            mcp_secrets.get("MCP_TOOL_QUEUE", TOOL_QUEUE))),
+        float(mcp_secrets.get("MCP_TOOL_QUEUE_TIMEOUT", TOOL_QUEUE_TIMEOUT)),
+    )
+
+
+def limit_tools(mcp) -> dict[str, AdmissionLimiter]:
+    """Wrapping every registered tool of a FastMCP server with admission control.
+
+    A concurrency of 0 leaves the tool unlimited, a queue timeout of 0 lets calls
+    wait until a slot is free.
+    """
+    limiters = {}
+    for tool in mcp._tool_manager.list_tools():
+        max_concurrency, max_queue, timeout = tool_limits(tool.name)
+        if max_concurrency <= 0:
+            continue
+        limiter = AdmissionLimiter(tool.name, max_concurrency, max_queue, timeout or None)
+        limiters[tool.name] = limiter
+        tool.fn = _admitted(tool.fn, tool.is_async, limiter)
+        tool.is_async = True
+    return limiters
+
+
+def _admitted(fn, is_async, limiter):
+    @functools.wraps(fn)
+    async def wrapper(**kwargs: Any) -> Any:
+        async with limiter.slot():
+            if is_async:
+                return await fn(**kwargs)
+            return fn(**kwargs)
+    return wrapper
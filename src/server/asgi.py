@@ -0,0 +1,198 @@
+### `src/server/asgi.py`
+### ASGI application serving the MCP server over SSE and streamable HTTP
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import contextlib
+import logging
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+from mcp.server import Server
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from .assets import assets, parse_width
+from .clients import clients
+from .config import secrets
+from .countries import countries, country_table_enabled
+from .database import database
+from .metrics import metrics
+from .subscriptions import watch_assets, watcher
+from .warmup import warmup
+from .workers import shutdown_process_pool
+logger = logging.getLogger(__name__)
+
+# Setting the transports, `sse` needs session affinity while stateless `http` does not
+TRANSPORTS = ("sse", "http", "both")
+
+
+# Reporting readiness only once the model is loaded
+async def handle_ready(request: Request) -> JSONResponse:
+    """Returning 200 when the model is warm and 503 while it is still loading."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+# Exposing handler metrics to Prometheus
+async def handle_metrics(request: Request) -> PlainTextResponse:
+    """Returning the metrics of this server process in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Serving image assets and their renditions with content-hash ETags
+async def handle_asset(request: Request) -> Response:
+    """Returning an image asset, or 304 if the `If-None-Match` header holds its current ETag.
+
+    The optional `width` query parameter selects a resized rendition.
+    """
+    name = request.path_params["image"]
+    width = request.query_params.get("width")
+    try:
+        width = None if width is None else parse_width(width)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    try:
+        etag = assets.get(name)["etag"] if width is None else assets.rendition_etag(name, width)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", "").replace('"', "").replace(" ", "").split(","):
+            return Response(status_code=304, headers=headers)
+        entry = assets.get(name) if width is None else await assets.rendition(name, width)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=404)
+    return Response(entry["content"], media_type=entry["mime_type"], headers=headers)
+
+
+# Creating the `StreamableHTTPApp` class
+class StreamableHTTPApp:
+    """Passing requests to the streamable HTTP session manager as a plain ASGI app.
+
+    Starlette treats functions given to `Route` as request/response endpoints,
+    so the handler is a callable instance instead.
+    """
+
+    def __init__(self, session_manager: StreamableHTTPSessionManager):
+        self.session_manager = session_manager
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.session_manager.handle_request(scope, receive, send)
+
+
+# Setting up the FastMCP server with capabilities
+def create_starlette_app(
+    mcp_server: Server,
+    *,
+    debug: bool = False,
+    transport: str = "both",
+    stateless: bool = True,
+    json_response: bool = False
+) -> Starlette:
+    """
+    Creating a Starlette application that serves the provided MCP server.
+
+    The SSE transport keeps a session in the process holding the `/sse` stream,
+    so its `/messages/` posts need session affinity. The streamable HTTP
+    transport at `/mcp` is stateless by default: every request carries all it
+    needs and can be served by any worker process.
+
+    Args:
+        mcp_server(Server): The low-level MCP server.
+        debug(bool): Showing tracebacks in error responses.
+        transport(str): `sse`, `http` or `both`.
+        stateless(bool): Serving streamable HTTP without sessions.
+        json_response(bool): Answering streamable HTTP requests with plain JSON instead of an SSE stream.
+
+    Returns:
+        Starlette: The ASGI application.
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Transport must be one of {', '.join(TRANSPORTS)}, not '{transport}'.")
+    routes = [
+        Route("/ready", endpoint=handle_ready),
+        Route("/metrics", endpoint=handle_metrics),
+        Route("/assets/{image}", endpoint=handle_asset),
+    ]
+
+    if transport in ("sse", "both"):
+        sse = SseServerTransport("/messages/")
+        async def handle_sse(request: Request) -> None:
+            async with sse.connect_sse(
+                    request.scope,
+                    request.receive,
+                    request._send,  # noqa: SLF001
+            ) as (read_stream, write_stream):
+                try:
+                    await mcp_server.run(
+                        read_stream,
+                        write_stream,
+                        mcp_server.create_initialization_options(),
+                    )
+                except asyncio.CancelledError:
+                    # Exiting gracefully when client disconnects
+                    return
+        routes += [
+            Route("/sse", endpoint=handle_sse),
+            Mount("/messages/", app=sse.handle_post_message),
+        ]
+
+    session_manager = None
+    if transport in ("http", "both"):
+        session_manager = StreamableHTTPSessionManager(
+            app=mcp_server,
+            json_response=json_response,
+            stateless=stateless,
+        )
+        handle_streamable_http = StreamableHTTPApp(session_manager)
+
+        # Routing `/mcp` itself explicitly, the static mount would answer it before any slash redirect
+        routes += [
+            Route("/mcp", endpoint=handle_streamable_http, methods=["GET", "POST", "DELETE"]),
+            Mount("/mcp", app=handle_streamable_http),
+        ]
+
+    routes.append(Mount("/", app=StaticFiles(directory="static", html=True), name="static"))
+
+    # Starting and stopping the process-wide resources with the server
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        """Owning process-wide resources for the lifetime of the Starlette app."""
+        # Warming up the model and watching the assets
+        warmup.start()
+        if watch_assets():
+            watcher.start()
+
+        # Loading the country table when a database is configured
+        if country_table_enabled():
+            countries.start()
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                if session_manager is not None:
+                    await stack.enter_async_context(session_manager.run())
+                yield
+        finally:
+            # Stopping the background tasks
+            await warmup.stop()
+            await watcher.stop()
+            await countries.stop()
+
+            # Closing the backend clients, database connections and worker processes
+            await clients.aclose()
+            await asyncio.to_thread(database.close)
+            shutdown_process_pool()
+
+    return Starlette(debug=debug, lifespan=lifespan, routes=routes)
+
+
+def create_app() -> Starlette:
+    """Creating the application from the server configuration, used by every uvicorn worker."""
+    from . import mcp
+    mcp_secrets = secrets.get("MCP", {})
+    return create_starlette_app(
+        mcp._mcp_server,
+        debug=str(mcp_secrets.get("MCP_DEBUG", "False")).lower() == "true",
+        transport=str(mcp_secrets.get("MCP_TRANSPORT", "both")),
+        stateless=str(mcp_secrets.get("MCP_STATELESS_HTTP", "True")).lower() == "true",
+        json_response=str(mcp_secrets.get("MCP_JSON_RESPONSE", "False")).lower() == "true",
+    )
@@ -0,0 +1,222 @@
+### `src/server/assets.py`
+### In-memory cache of image assets and their resized renditions with content-hash ETags
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from .config import secrets
+from .imaging import resize_to_width
+from .workers import run_in_process
+logger = logging.getLogger(__name__)
+
+# Setting the directory holding the image assets
+ASSETS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "assets"))
+
+# Setting the widest rendition and the number of renditions kept in memory
+MAX_RENDITION_WIDTH = 4096
+MAX_RENDITIONS = 64
+
+# Setting how often a cached asset checks the modification time of its file
+REVALIDATE_SECONDS = 1.0
+
+
+def make_etag(data: bytes, *parts: str) -> str:
+    """Hashing the content of an asset together with every part that changes its rendition."""
+    digest = hashlib.sha256(data)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+# Creating the `AssetCache` class
+class AssetCache:
+    """Caching the raw and base64-encoded bytes of image assets keyed by name and width.
+
+    An entry is valid as long as the modification time and size of its file are
+    unchanged. The file is checked at most every `revalidate` seconds, so repeated
+    reads are served from memory without touching the disk or the encoder.
+    Renditions carry an ETag derived from the ETag of their source, so a client
+    holding a current rendition can be answered without resizing anything.
+
+    Example:
+        .. code-block:: python
+
+            assets = AssetCache()
+            entry = assets.get("Image.png")
+            entry = await assets.rendition("Image.png", 200)
+            entry["data"], entry["etag"]
+    """
+
+    def __init__(
+        self,
+        directory: str = ASSETS_DIR,
+        max_renditions: int = MAX_RENDITIONS,
+        revalidate: float = REVALIDATE_SECONDS
+    ):
+        self._directory = os.path.realpath(directory)
+        self._max_renditions = max_renditions
+        self._revalidate = revalidate
+        self._originals: dict[str, dict] = {}
+        self._renditions: OrderedDict[tuple[str, int, Optional[str]], dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resizes = 0
+
+    def path(self, name: str) -> str:
+        """Returning the path of an asset, refusing names which leave the asset directory."""
+        path = os.path.realpath(os.path.join(self._directory, name))
+        if os.path.dirname(path) != self._directory:
+            raise ValueError(f"Asset '{name}' is not in the asset directory.")
+        return path
+
+    @staticmethod
+    def _version(path: str) -> tuple[int, int]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ValueError(f"Asset '{os.path.basename(path)}' does not exist.") from None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _fresh(self, entry: dict, path: str) -> bool:
+        """Checking the file of a cached entry, at most once per revalidation interval."""
+        now = time.monotonic()
+        if now - entry["checked"] < self._revalidate:
+            return True
+        if self._version(path) != entry["version"]:
+            return False
+        entry["checked"] = now
+        return True
+
+    def get(self, name: str) -> dict:
+        """Returning the cached asset, reading and encoding its file only if it changed.
+
+        Returns:
+            dict: The raw `content`, base64 `data`, `etag`, `mime_type`, `size` and `mtime` of the asset.
+
+        Raises:
+            ValueError: If the asset does not exist or is outside the asset directory.
+        """
+        path = self.path(name)
+        with self._lock:
+            entry = self._originals.get(name)
+        if entry is not None and self._fresh(entry, path):
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        # Reading and encoding the file once per version
+        version = self._version(path)
+        with open(path, "rb") as image_file:
+            content = image_file.read()
+        entry = {
+            "content": content,
+            "data": base64.b64encode(content).decode("utf-8"),
+            "etag": make_etag(content),
+            "mime_type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+            "size": len(content),
+            "mtime": version[0] / 1e9,
+            "version": version,
+            "checked": time.monotonic(),
+        }
+        with self._lock:
+            if name in self._originals:
+                logger.info(f"Asset {name} changed, dropping its cached renditions.")
+                for key in [key for key in self._renditions if key[0] == name]:
+                    del self._renditions[key]
+            self._originals[name] = entry
+            self.misses += 1
+        return entry
+
+    def invalidate(self, name: str) -> None:
+        """Dropping an asset and its renditions, e.g. when a watcher saw its file change."""
+        with self._lock:
+            self._originals.pop(name, None)
+            for key in [key for key in self._renditions if key[0] == name]:
+                del self._renditions[key]
+
+    def rendition_etag(self, name: str, width: int, image_format: Optional[str] = None) -> str:
+        """Returning the ETag of a rendition from the ETag of its current source."""
+        return self._rendition_etag(self.get(name), width, image_format)
+
+    @staticmethod
+    def _rendition_etag(original: dict, width: int, image_format: Optional[str]) -> str:
+        parts = (width,) if image_format is None else (width, image_format)
+        return make_etag(original["etag"].encode("utf-8"), *parts)
+
+    async def rendition(self, name: str, width: int, image_format: Optional[str] = None) -> dict:
+        """Returning the cached rendition of an asset `width` pixels wide, resizing it in the process pool.
+
+        The rendition keeps the format of the asset where possible, unless
+        `image_format` (PNG, JPEG or WEBP) asks for another one.
+
+        Raises:
+            ValueError: If the width is out of range or the asset is unavailable.
+        """
+        if not 0 < width <= MAX_RENDITION_WIDTH:
+            raise ValueError(f"Width must be between 1 and {MAX_RENDITION_WIDTH} pixels, not {width}.")
+        original = self.get(name)
+        key = (name, width, image_format)
+        with self._lock:
+            entry = self._renditions.get(key)
+            if entry is not None and entry["version"] == original["version"]:
+                self._renditions.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        # Resizing off the event loop and evicting the least recently used rendition
+        content, mime_type = await run_in_process(resize_to_width, original["content"], width, image_format)
+        entry = {
+            "content": content,
+            "data": base64.b64encode(content).decode("utf-8"),
+            "etag": self._rendition_etag(original, width, image_format),
+            "mime_type": mime_type,
+            "size": len(content),
+            "mtime": original["mtime"],
+            "version": original["version"],
+        }
+        with self._lock:
+            self._renditions[key] = entry
+            self._renditions.move_to_end(key)
+            while len(self._renditions) > self._max_renditions:
+                self._renditions.popitem(last=False)
+            self.misses += 1
+            self.resizes += 1
+        return entry
+
+    def stats(self) -> dict:
+        """Returning the hit, miss and resize counts and the number of cached entries."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "resizes": self.resizes,
+                "originals": len(self._originals),
+                "renditions": len(self._renditions),
+            }
+
+
+def parse_width(width: str) -> int:
+    """Parsing and range-checking the width of a rendition from a resource URI or query string."""
+    try:
+        value = int(width)
+    except (TypeError, ValueError):
+        raise ValueError(f"Width must be a whole number of pixels, not '{width}'.") from None
+    if not 0 < value <= MAX_RENDITION_WIDTH:
+        raise ValueError(f"Width must be between 1 and {MAX_RENDITION_WIDTH} pixels, not {value}.")
+    return value
+
+
+# Creating the asset cache shared by the image resources and the `/assets` route
+assets = AssetCache(
+    max_renditions=int(secrets.get("MCP", {}).get("MCP_ASSET_RENDITIONS", MAX_RENDITIONS)),
+    revalidate=float(secrets.get("MCP", {}).get("MCP_ASSET_REVALIDATE_SECONDS", REVALIDATE_SECONDS)),
+)
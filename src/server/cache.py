@@ -0,0 +1,118 @@
+### `src/server/cache.py`
+### Content-addressed result cache for MCP server tools
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+logger = logging.getLogger(__name__)
+
+
+# Creating the `ResultCache` class
+class ResultCache:
+    """Two-tier cache with an in-memory LRU in front of JSON files on disk.
+
+    Example:
+        .. code-block:: python
+
+            cache = ResultCache(max_entries=256, directory=".cache/results")
+            key = ResultCache.make_key(image_bytes, model, system_prompt)
+            result = cache.get(key)
+            if result is None:
+                result = {"description": "..."}
+                cache.set(key, result)
+    """
+
+    def __init__(self, max_entries: int = 256, directory: Optional[str] = None):
+        self._max_entries = max_entries
+        self._directory = directory
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(data: bytes, *parts: str) -> str:
+        """Hashing the payload together with every part that changes the result."""
+        digest = hashlib.sha256(data)
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(str(part).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: Any) -> None:
+        # Moving the key to the front and evicting the least recently used entry
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returning the cached value for `key` or None on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        # Falling back to the disk tier and promoting hits into memory
+        if self._directory:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as cache_file:
+                    value = json.load(cache_file)
+            except FileNotFoundError:
+                value = None
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Storing a JSON-serializable value in memory and on disk."""
+        self._remember(key, value)
+        if not self._directory:
+            return
+
+        # Writing atomically so a crash never leaves a truncated entry behind
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+                json.dump(value, cache_file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+
+    def stats(self) -> dict:
+        """Returning hit and miss counters of both tiers."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
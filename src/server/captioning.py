@@ -0,0 +1,230 @@
+### `src/server/captioning.py`
+### Bucket-wide image captioning job feeding the Snowflake vector store
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import argparse
+import asyncio
+import collections
+import fnmatch
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Optional
+from .clients import clients
+from .config import secrets
+from .image_recognition import CACHE_DIR, recognize_image, max_image_bytes
+from .minio import get_minio_client, get_object_bytes, iter_objects
+from .workers import shutdown_process_pool
+logger = logging.getLogger(__name__)
+
+# Setting the object name patterns which are treated as images
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.webp", "*.gif", "*.bmp", "*.tif", "*.tiff")
+
+
+def _load_checkpoint(path: Optional[str]) -> dict:
+    """Loading the progress of a previous run, or an empty checkpoint."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as checkpoint_file:
+            return json.load(checkpoint_file)
+    return {"last_key": None, "captioned": 0, "failed": 0, "failed_keys": []}
+
+
+def _save_checkpoint(path: Optional[str], checkpoint: dict) -> None:
+    """Writing the checkpoint atomically so an interrupted run can resume from it."""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+async def caption_bucket(
+    bucket_name: str,
+    vector_store: Any,
+    concurrency: int = 4,
+    batch_size: int = 32,
+    prefix: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    start_after: Optional[str] = None,
+) -> dict:
+    """
+    Describing every image of a MinIO bucket and adding the descriptions to a vector store.
+
+    Objects are listed lazily in key order and at most `concurrency` images are
+    in flight, so memory stays bounded for buckets of any size. Descriptions are
+    written in batches of `batch_size` through `vector_store.add_texts`. After
+    each batch the checkpoint stores the highest key below which every object
+    is written or has failed, so a rerun continues from there. Failed keys are
+    kept in the checkpoint and retried first by the next run.
+
+    Args:
+        bucket_name(str): The MinIO bucket to walk.
+        vector_store: A `SnowflakeVectorStore` (or any LangChain vector store).
+        concurrency(int): The number of images described at the same time.
+        batch_size(int): The number of descriptions per vector store write.
+        prefix(str): Only captioning objects below this prefix.
+        checkpoint_path(str): JSON file holding the progress of the job.
+        start_after(str): Object key to start after, overriding the checkpoint.
+
+    Returns:
+        dict: The final checkpoint with 'last_key', 'captioned', 'failed' and 'failed_keys'.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path)
+    checkpoint.setdefault("failed_keys", [])
+    if start_after is not None:
+        checkpoint["last_key"] = start_after
+    if checkpoint["last_key"]:
+        logger.info(f"Resuming captioning of {bucket_name} after {checkpoint['last_key']}.")
+
+    minio_client = get_minio_client()
+    endpoint = secrets["MinIO"]["endpoint"]
+    objects = iter_objects(minio_client, bucket_name, prefix, checkpoint["last_key"])
+
+    # Retrying the failed keys of previous runs before listing new objects
+    retries = collections.deque(checkpoint["failed_keys"])
+    retrying: set[str] = set()
+    recovered: list[str] = []
+    if retries:
+        logger.info(f"Retrying {len(retries)} images of {bucket_name} which failed before.")
+
+    # Tracking scheduled keys in listing order to derive a safe resume point
+    order: collections.deque = collections.deque()
+    done: set[str] = set()
+    texts: list[str] = []
+    metadatas: list[dict] = []
+    pending: set[asyncio.Task] = set()
+
+    async def _caption(key: str) -> Optional[tuple[str, dict]]:
+        try:
+            image_bytes = await asyncio.to_thread(
+                get_object_bytes, minio_client, bucket_name, key, max_image_bytes())
+            result = await recognize_image(image_bytes)
+        except Exception as e:
+            logger.error(f"Captioning failed for {key}: {e}")
+            return None
+        filename = os.path.basename(key)
+        return f"{filename}: {result['description']}", {
+            "source": f"{endpoint}/{bucket_name}/{key}",
+            "filename": filename,
+            "page": 0,
+        }
+
+    def _collect(finished: set[asyncio.Task]) -> None:
+        for task in finished:
+            key, document = task.result()
+            if key in retrying:
+                retrying.discard(key)
+            else:
+                done.add(key)
+            if document is None:
+                if key not in checkpoint["failed_keys"]:
+                    checkpoint["failed_keys"].append(key)
+            else:
+                texts.append(document[0])
+                metadatas.append(document[1])
+                if key in checkpoint["failed_keys"]:
+                    recovered.append(key)
+
+    async def _flush() -> None:
+        # Writing the buffered descriptions, then advancing the resume point
+        if texts:
+            await asyncio.to_thread(vector_store.add_texts, list(texts), list(metadatas))
+            checkpoint["captioned"] += len(texts)
+            texts.clear()
+            metadatas.clear()
+
+        # Forgetting failed keys only once their retried descriptions are written
+        checkpoint["failed_keys"] = [key for key in checkpoint["failed_keys"] if key not in recovered]
+        checkpoint["failed"] = len(checkpoint["failed_keys"])
+        recovered.clear()
+        while order and order[0] in done:
+            checkpoint["last_key"] = order.popleft()
+            done.discard(checkpoint["last_key"])
+        _save_checkpoint(checkpoint_path, checkpoint)
+        logger.info(
+            f"Captioned {checkpoint['captioned']} images of {bucket_name} "
+            f"({checkpoint['failed']} failed), resume point {checkpoint['last_key']}.")
+
+    async def _run(key: str) -> tuple[str, Optional[tuple[str, dict]]]:
+        return key, await _caption(key)
+
+    while True:
+        if retries:
+            key = retries.popleft()
+            retrying.add(key)
+        else:
+            key = await asyncio.to_thread(next, objects, None)
+            if key is None:
+                break
+            if not any(fnmatch.fnmatch(key.lower(), pattern) for pattern in IMAGE_PATTERNS):
+                continue
+            order.append(key)
+        pending.add(asyncio.create_task(_run(key)))
+
+        # Waiting for a free slot before listing the next object
+        if len(pending) >= concurrency:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            _collect(finished)
+            if len(texts) >= batch_size:
+                await _flush()
+
+    # Draining the remaining work and writing the last batch
+    if pending:
+        finished, _ = await asyncio.wait(pending)
+        _collect(finished)
+    await _flush()
+    return checkpoint
+
+
+def main() -> None:
+    """Running the captioning job from the command line."""
+    parser = argparse.ArgumentParser(description="Caption all images of a MinIO bucket into a vector store")
+    parser.add_argument("--bucket", default=secrets["MinIO"]["bucket"], help="MinIO bucket to walk")
+    parser.add_argument("--table", default="LANGCHAIN_IMAGES", help="Snowflake vector store table")
+    parser.add_argument("--prefix", default=None, help="Only caption objects below this prefix")
+    parser.add_argument("--concurrency", type=int, default=4, help="Images described at the same time")
+    parser.add_argument("--batch-size", type=int, default=32, help="Descriptions per vector store write")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file, defaults to the cache directory")
+    parser.add_argument("--start-after", default=None, help="Object key to resume after")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Creating the vector store on the Snowflake session
+    from .snowrag.snowrag import create_session
+    from .snowrag.embedding import SnowflakeEmbeddings
+    from .snowrag.vectorstores import SnowflakeVectorStore
+    connection = create_session().connection
+    vector_store = SnowflakeVectorStore(
+        table=args.table,
+        connection=connection,
+        embedding=SnowflakeEmbeddings(connection=connection),
+    )
+
+    checkpoint_path = args.checkpoint or (
+        os.path.join(CACHE_DIR, "captioning", f"{args.bucket}-{args.table}.json")
+        if CACHE_DIR else None
+    )
+
+    async def _main() -> dict:
+        try:
+            return await caption_bucket(
+                args.bucket,
+                vector_store,
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                prefix=args.prefix,
+                checkpoint_path=checkpoint_path,
+                start_after=args.start_after,
+            )
+        finally:
+            await clients.aclose()
+            shutdown_process_pool()
+
+    print(json.dumps(asyncio.run(_main())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+### `src/server/clients.py`
+### Long-lived LLM client registry for MCP server tools
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import logging
+import httpx
+from typing import TYPE_CHECKING, Optional
+from .config import secrets
+logger = logging.getLogger(__name__)
+
+# Importing the SDKs for type checking only, they are imported when a client is first created
+if TYPE_CHECKING:
+    from ollama import AsyncClient
+    from openai import AsyncAzureOpenAI
+
+
+# Creating the `ClientRegistry` class
+class ClientRegistry:
+    """Creating backend clients once per server process and sharing their connection pools.
+
+    Example:
+        .. code-block:: python
+
+            from .clients import clients
+            resp = await clients.ollama().chat(model="llava", messages=[...])
+            ...
+            await clients.aclose()
+    """
+
+    def __init__(self):
+        self._ollama: Optional["AsyncClient"] = None
+        self._azure_openai: Optional["AsyncAzureOpenAI"] = None
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        """Reading the keep-alive pool limits from the MCP secrets."""
+        mcp_secrets = secrets.get("MCP", {})
+        return httpx.Limits(
+            max_connections=int(mcp_secrets.get("MCP_HTTP_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=int(mcp_secrets.get("MCP_HTTP_MAX_KEEPALIVE", 10)),
+            keepalive_expiry=float(mcp_secrets.get("MCP_HTTP_KEEPALIVE_EXPIRY", 30)),
+        )
+
+    def ollama(self) -> "AsyncClient":
+        """Returning the shared Ollama client."""
+        if self._ollama is None:
+            from ollama import AsyncClient
+            self._ollama = AsyncClient(
+                host=f"{secrets['OLLAMA']['OLLAMA_URL']}",
+                limits=self._limits()
+            )
+            logger.info("Created pooled Ollama client.")
+        return self._ollama
+
+    def azure_openai(self) -> "AsyncAzureOpenAI":
+        """Returning the shared Azure OpenAI client."""
+        if self._azure_openai is None:
+            from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+            azure_openai_secrets = secrets['AZURE_OPENAI']
+            self._azure_openai = AsyncAzureOpenAI(
+                api_key=azure_openai_secrets['AZURE_OPENAI_API_KEY'],
+                azure_endpoint=azure_openai_secrets['AZURE_OPENAI_ENDPOINT'],
+                api_version=azure_openai_secrets.get('AZURE_OPENAI_API_VERSION', '2024-02-15-preview'),
+                http_client=DefaultAsyncHttpxClient(limits=self._limits())
+            )
+            logger.info("Created pooled Azure OpenAI client.")
+        return self._azure_openai
+
+    async def aclose(self) -> None:
+        """Closing every client and its connection pool."""
+        if self._ollama is not None:
+            await self._ollama.close()
+            self._ollama = None
+        if self._azure_openai is not None:
+            await self._azure_openai.close()
+            self._azure_openai = None
+        logger.info("Closed pooled LLM clients.")
+
+
+# Creating the registry shared by all tools of this server process
+clients = ClientRegistry()
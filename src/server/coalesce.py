@@ -0,0 +1,93 @@
+### `src/server/coalesce.py`
+### Single-flight coalescing of identical in-flight MCP tool calls
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable
+from .metrics import metrics
+logger = logging.getLogger(__name__)
+
+
+# Creating the `SingleFlight` class
+class SingleFlight:
+    """Running one call per key at a time and sharing its result with concurrent callers.
+
+    The call runs in its own task, so a caller which is cancelled (e.g. a client
+    disconnecting) does not cancel the call for the other waiting callers.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Awaiting the in-flight call for `key`, or starting `fn` if there is none."""
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+            return await asyncio.shield(task)
+
+        # Counting the time on the call of another caller as wait time
+        self.shared += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.shield(task)
+        finally:
+            metrics.add_wait(time.perf_counter() - start)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        # Removing the finished call and marking its exception as retrieved
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """Returning executed and shared call counts."""
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+def call_key(name: str, arguments: dict) -> str:
+    """Hashing a tool name with its validated arguments into a coalescing key."""
+    normalized = json.dumps(arguments, sort_keys=True, default=repr)
+    return hashlib.sha256(f"{name}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def coalesce_tools(mcp) -> dict[str, SingleFlight]:
+    """Wrapping every registered tool of a FastMCP server with single-flight coalescing.
+
+    Returns the `SingleFlight` of every tool by name. Only the first of several
+    identical concurrent calls reaches the backend; progress notifications are
+    sent to that caller only, the others receive the shared result.
+    """
+    flights = {}
+    for tool in mcp._tool_manager.list_tools():
+        flight = SingleFlight()
+        flights[tool.name] = flight
+        tool.fn = _coalesced(tool.name, tool.fn, tool.is_async, tool.context_kwarg, flight)
+        tool.is_async = True
+    return flights
+
+
+def _coalesced(name, fn, is_async, context_kwarg, flight):
+    @functools.wraps(fn)
+    async def wrapper(**kwargs):
+        # Leaving the request context out of the key as it differs per caller
+        arguments = {k: v for k, v in kwargs.items() if k != context_kwarg}
+
+        async def _call():
+            if is_async:
+                return await fn(**kwargs)
+            return fn(**kwargs)
+
+        return await flight.do(call_key(name, arguments), _call)
+    return wrapper
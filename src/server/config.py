@@ -0,0 +1,109 @@
+### `src/server/config.py`
+### Immutable configuration of the MCP server, loaded once at import
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import logging
+import os
+import tomllib
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Optional
+logger = logging.getLogger(__name__)
+
+# Setting the prefix of environment variables for each secrets section
+ENV_PREFIXES = {
+    "MCP": "MCP_",
+    "OLLAMA": "OLLAMA_",
+    "AZURE_OPENAI": "AZURE_OPENAI_",
+    "DB": "DB_",
+    "MinIO": "MINIO_",
+}
+
+# Setting the sections whose keys are lower-case and carry no prefix, e.g. `[MinIO] endpoint`
+PLAIN_KEY_SECTIONS = ("MinIO",)
+
+# Setting the top-level keys which can be overridden by environment variables
+ENV_KEYS = ("LLM_LOCAL", "SNOWFLAKE")
+
+
+def secrets_paths() -> list[str]:
+    """Returning the `secrets.toml` files in the order Streamlit reads them.
+
+    The global file in the home directory comes first, the project file in the
+    working directory overrides it and `MCP_SECRETS_FILE` overrides both.
+    """
+    paths = [
+        os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+        os.path.join(os.getcwd(), ".streamlit", "secrets.toml"),
+    ]
+    if os.environ.get("MCP_SECRETS_FILE"):
+        paths.append(os.environ["MCP_SECRETS_FILE"])
+    return paths
+
+
+def _section_key(section: str, name: str) -> str:
+    """Mapping an environment variable to the key of its section."""
+    if section in PLAIN_KEY_SECTIONS:
+        return name[len(ENV_PREFIXES[section]):].lower()
+    return name
+
+
+def _freeze(value: Any) -> Any:
+    """Wrapping nested tables in read-only mappings."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def load_secrets(
+    paths: Optional[Iterable[str]] = None,
+    environ: Optional[Mapping[str, str]] = None
+) -> Mapping[str, Any]:
+    """
+    Loading the server configuration from `secrets.toml` files and environment variables.
+
+    Environment variables take precedence over the files. Section keys map to
+    variables with the section prefix, e.g. `OLLAMA_MODEL` for
+    `[OLLAMA] OLLAMA_MODEL` and `MINIO_ENDPOINT` for `[MinIO] endpoint`.
+
+    Args:
+        paths: The TOML files to read, later files override earlier ones.
+        environ: The environment, defaults to `os.environ`.
+
+    Returns:
+        Mapping: A read-only mapping of top-level keys and sections.
+    """
+    paths = secrets_paths() if paths is None else paths
+    environ = os.environ if environ is None else environ
+    merged: dict[str, Any] = {}
+    for path in paths:
+        try:
+            with open(path, "rb") as secrets_file:
+                data = tomllib.load(secrets_file)
+        except FileNotFoundError:
+            continue
+        logger.info(f"Loaded configuration from {path}.")
+        for key, value in data.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key].update(value)
+            else:
+                merged[key] = dict(value) if isinstance(value, dict) else value
+
+    # Applying environment overrides to known sections and top-level keys
+    for key in ENV_KEYS:
+        if key in environ:
+            merged[key] = environ[key]
+    for section, prefix in ENV_PREFIXES.items():
+        values = merged.setdefault(section, {})
+        for name, value in environ.items():
+            if name.startswith(prefix) and name != "MCP_SECRETS_FILE":
+                values[_section_key(section, name)] = value
+    return _freeze(merged)
+
+
+# Loading the configuration shared by all tools of this server process
+secrets = load_secrets()
+
+# Choosing between Ollama (local) and Azure OpenAI once at startup
+LLM_LOCAL = str(secrets.get("LLM_LOCAL", "False")).lower() == "true"
@@ -0,0 +1,215 @@
+### `src/server/countries.py`
+### In-memory ISO-3166 country table with periodic refresh from MySQL
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import logging
+import time
+from typing import Optional
+from .config import secrets
+from .database import DatabasePool, database
+from .trigrams import TrigramIndex
+logger = logging.getLogger(__name__)
+
+# Setting the seconds between refreshes of the table and after a failed load
+REFRESH_INTERVAL = 3600.0
+RETRY_INTERVAL = 30.0
+
+# Setting how many unknown codes are remembered, bounding the memory of bogus lookups
+MAX_MISSING = 4096
+
+# Setting the queries of the whole table and of a single country
+TABLE_QUERY = "SELECT CODE, `ShortName de` FROM stage$iso3166;"
+COUNTRY_QUERY = "SELECT `ShortName de` FROM stage$iso3166 WHERE CODE = %s;"
+COUNTRIES_QUERY = "SELECT CODE, `ShortName de` FROM stage$iso3166 WHERE CODE IN ({placeholders});"
+
+# Setting the codes per `IN` query, keeping statements well below the packet limit
+QUERY_CHUNK = 500
+
+
+def normalize_code(country_code: str) -> str:
+    """Normalizing a country code the way MySQL compares it, ignoring case and surrounding blanks."""
+    return country_code.strip().upper()
+
+
+# Creating the `CountryTable` class
+class CountryTable:
+    """Holding the German short names of the ISO-3166 table in memory.
+
+    The table is loaded on server start and replaced as a whole on every refresh,
+    so lookups are dict reads without I/O. Only a code missing from the table is
+    queried from MySQL. Found codes are added, codes MySQL does not know either
+    are remembered as missing until the next refresh. Every refresh also rebuilds
+    the trigram index used to find codes by (misspelled) name.
+
+    Example:
+        .. code-block:: python
+
+            countries = CountryTable()
+            countries.start()
+            name = await countries.lookup("DE")
+            ...
+            await countries.stop()
+    """
+
+    def __init__(self, db: Optional[DatabasePool] = None):
+        self._db = db or database
+        self._names: dict[str, str] = {}
+        self._missing: set[str] = set()
+        self.index = TrigramIndex({})
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.db_lookups = 0
+
+    @staticmethod
+    def _interval() -> float:
+        return float(secrets.get("DB", {}).get("DB_COUNTRY_REFRESH", REFRESH_INTERVAL))
+
+    async def refresh(self) -> int:
+        """Loading the whole table from MySQL and replacing the in-memory copy.
+
+        Returns:
+            int: The number of countries loaded.
+
+        Raises:
+            mysql.connector.Error: If the table cannot be read.
+        """
+        async with self._refresh_lock:
+            rows = await self._db.query(TABLE_QUERY)
+            names = {
+                normalize_code(row["CODE"]): row["ShortName de"]
+                for row in rows if row["CODE"] and row["ShortName de"]
+            }
+            self._names, self._missing, self.index = names, set(), TrigramIndex(names)
+            self.loaded_at = time.time()
+            self.refreshes += 1
+            self.last_error = None
+        logger.info(f"Loaded {len(names)} countries into memory.")
+        return len(names)
+
+    async def run(self) -> None:
+        """Refreshing the table periodically until cancelled, retrying sooner after a failure."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Loading the country table failed: {e}")
+                await asyncio.sleep(RETRY_INTERVAL)
+                continue
+            if self._interval() <= 0:
+                return
+            await asyncio.sleep(self._interval())
+
+    def start(self) -> None:
+        """Starting the load and periodic refresh in the background of the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancelling the background refresh."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get(self, country_code: str) -> Optional[str]:
+        """Returning the name of a country from memory, None if the table does not hold it."""
+        return self._names.get(normalize_code(country_code))
+
+    async def lookup(self, country_code: str) -> Optional[str]:
+        """Returning the name of a country, querying MySQL only for codes missing from memory.
+
+        Raises:
+            mysql.connector.Error: If a code has to be queried and the query fails.
+        """
+        code = normalize_code(country_code)
+        name = self._names.get(code)
+        if name is not None:
+            self.hits += 1
+            return name
+        self.misses += 1
+        if code in self._missing:
+            return None
+
+        # Falling back to the database and remembering its answer until the next refresh
+        self.db_lookups += 1
+        rows = await self._db.query(COUNTRY_QUERY, (code,))
+        if not rows:
+            if len(self._missing) >= MAX_MISSING:
+                self._missing.clear()
+            self._missing.add(code)
+            return None
+        name = rows[0]["ShortName de"]
+        self._names[code] = name
+        return name
+
+    async def lookup_many(self, country_codes: list[str]) -> dict[str, Optional[str]]:
+        """Returning the names of many countries, querying the codes missing from memory with one `IN` query.
+
+        Args:
+            country_codes: Normalized country codes.
+
+        Returns:
+            dict: The name of every code, None for codes MySQL does not know either.
+
+        Raises:
+            mysql.connector.Error: If codes have to be queried and the query fails.
+        """
+        names: dict[str, Optional[str]] = {}
+        unknown = []
+        for code in dict.fromkeys(country_codes):
+            name = self._names.get(code)
+            if name is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if code not in self._missing:
+                    unknown.append(code)
+            names[code] = name
+
+        # Falling back to the database for all unknown codes at once
+        for start in range(0, len(unknown), QUERY_CHUNK):
+            chunk = unknown[start:start + QUERY_CHUNK]
+            self.db_lookups += 1
+            rows = await self._db.query(
+                COUNTRIES_QUERY.format(placeholders=", ".join(["%s"] * len(chunk))), chunk)
+            found = {normalize_code(row["CODE"]): row["ShortName de"] for row in rows}
+            for code in chunk:
+                if code in found:
+                    self._names[code] = names[code] = found[code]
+                else:
+                    if len(self._missing) >= MAX_MISSING:
+                        self._missing.clear()
+                    self._missing.add(code)
+        return names
+
+    def stats(self) -> dict:
+        """Returning the size and age of the table and its hit, miss and database lookup counts."""
+        return {
+            "countries": len(self._names),
+            "missing": len(self._missing),
+            "loaded_at": self.loaded_at,
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+            "hits": self.hits,
+            "misses": self.misses,
+            "db_lookups": self.db_lookups,
+        }
+
+
+def country_table_enabled() -> bool:
+    """Checking whether a database is configured to load the country table from."""
+    return bool(secrets.get("DB", {}).get("DB_HOST"))
+
+
+# Creating the country table shared by the tools of this server process
+countries = CountryTable()
@@ -0,0 +1,153 @@
+### `src/server/database.py`
+### Pooled MySQL access for MCP server tools without blocking the event loop
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Optional, Sequence
+from .config import secrets
+from .metrics import metrics
+logger = logging.getLogger(__name__)
+
+# Importing the connector for type checking only, it is imported when the pool is first created
+if TYPE_CHECKING:
+    from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
+
+# Setting the pool defaults, mysql.connector allows at most 32 connections per pool
+POOL_SIZE = 5
+POOL_RECYCLE = 3600.0
+POOL_PING_INTERVAL = 30.0
+CONNECT_TIMEOUT = 10
+
+
+# Creating the `DatabasePool` class
+class DatabasePool:
+    """Sharing a pool of MySQL connections between all calls of this server process.
+
+    Queries run on a dedicated thread pool with one thread per connection, so a
+    call never waits for a connection inside a thread and never blocks the event
+    loop. A connection is pinged before use when it was idle longer than
+    `DB_POOL_PING_INTERVAL` seconds and reconnected once it is older than
+    `DB_POOL_RECYCLE` seconds, so connections dropped by the server or a proxy
+    are replaced instead of failing a call.
+
+    Example:
+        .. code-block:: python
+
+            from .database import database
+            rows = await database.query("SELECT * FROM stage$iso3166 WHERE CODE = %s", ("DE",))
+            ...
+            database.close()
+    """
+
+    def __init__(self):
+        self._pool: Optional["MySQLConnectionPool"] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._created: dict[int, float] = {}
+        self._used: dict[int, float] = {}
+        self.pings = 0
+        self.recycles = 0
+
+    @staticmethod
+    def _settings() -> dict:
+        """Reading the connection and pool settings from the DB secrets."""
+        db_secrets = secrets["DB"]
+        return {
+            "pool_size": int(db_secrets.get("DB_POOL_SIZE", POOL_SIZE)),
+            "recycle": float(db_secrets.get("DB_POOL_RECYCLE", POOL_RECYCLE)),
+            "ping_interval": float(db_secrets.get("DB_POOL_PING_INTERVAL", POOL_PING_INTERVAL)),
+            "connection": {
+                "host": db_secrets["DB_HOST"],
+                "port": int(db_secrets["DB_PORT"]),
+                "user": db_secrets["DB_USER"],
+                "password": db_secrets["DB_PASSWORD"],
+                "database": db_secrets["DB_NAME"],
+                "connection_timeout": int(db_secrets.get("DB_CONNECT_TIMEOUT", CONNECT_TIMEOUT)),
+            },
+        }
+
+    def _executor_for(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._settings()["pool_size"], thread_name_prefix="mysql")
+            return self._executor
+
+    def _connection(self) -> "PooledMySQLConnection":
+        """Taking a healthy connection from the pool, creating the pool on first use."""
+        settings = self._settings()
+        with self._lock:
+            if self._pool is None:
+                from mysql.connector.pooling import MySQLConnectionPool
+                self._pool = MySQLConnectionPool(
+                    pool_name="benbox", pool_size=settings["pool_size"], **settings["connection"])
+                logger.info(f"Created MySQL connection pool with {settings['pool_size']} connections.")
+            pool = self._pool
+        conn = pool.get_connection()
+        key = id(conn._cnx)  # noqa: SLF001
+        now = time.monotonic()
+
+        # Recycling old connections and pinging the ones idle for a while
+        created = self._created.setdefault(key, now)
+        if settings["recycle"] > 0 and now - created > settings["recycle"]:
+            conn.reconnect(attempts=2, delay=0)
+            self._created[key] = time.monotonic()
+            self.recycles += 1
+        elif now - self._used.get(key, now) > settings["ping_interval"]:
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            self.pings += 1
+        self._used[key] = time.monotonic()
+        return conn
+
+    def _query(self, sql: str, params: Sequence[Any]) -> list[dict]:
+        conn = self._connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(sql, tuple(params))
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        finally:
+            # Returning the connection to the pool, which resets its session
+            conn.close()
+
+    async def query(self, sql: str, params: Sequence[Any] = ()) -> list[dict]:
+        """Running a query on a pooled connection and returning its rows as dicts.
+
+        Raises:
+            mysql.connector.Error: If the query or the connection fails.
+        """
+        loop = asyncio.get_running_loop()
+        with metrics.backend("mysql"):
+            return await loop.run_in_executor(self._executor_for(), self._query, sql, params)
+
+    def stats(self) -> dict:
+        """Returning the pool size and the pings and recycles of its connections."""
+        return {
+            "created": self._pool is not None,
+            "pool_size": self._pool.pool_size if self._pool is not None else 0,
+            "pings": self.pings,
+            "recycles": self.recycles,
+        }
+
+    def close(self) -> None:
+        """Closing the idle connections of the pool and stopping its threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pool, self._pool = self._pool, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if pool is not None:
+            pool._remove_connections()  # noqa: SLF001
+            self._created.clear()
+            self._used.clear()
+            logger.info("Closed MySQL connection pool.")
+
+
+# Creating the pool shared by all tools of this server process
+database = DatabasePool()
@@ -2,12 +2,15 @@
 ### MCP server tool for image recognition
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
-import streamlit as st
 from . import mcp
 import mysql.connector
 import logging
+from .countries import countries, normalize_code
 logger = logging.getLogger(__name__)
 
+# Setting the most country codes resolved by one call of `get_country_names`
+MAX_BATCH_CODES = 1000
+
 
 @mcp.tool()
 async def get_country_name(country_code: str = None) -> str:
@@ -25,41 +28,105 @@ async def get_country_name(country_code: str = None) -> str:
         ValueError: If no matching country is found.
         Exception: For database connection errors.
     """
-    # Setting up DB connection parameters from Streamlit secrets
-    db_secrets = st.secrets["DB"]
+    if not country_code:
+        raise ValueError("Country_code must be provided.")
+
+    # Reading the name from the in-memory table, which queries the database only on a miss
     try:
-        conn = mysql.connector.connect(
-            host=db_secrets["DB_HOST"],
-            port=db_secrets["DB_PORT"],
-            user=db_secrets["DB_USER"],
-            password=db_secrets["DB_PASSWORD"],
-            database=db_secrets["DB_NAME"]
-        )
-    except Exception as e:
-        logger.error(f"Database connection failed: {e}")
-        raise Exception("Could not connect to the database.")
+        name = await countries.lookup(country_code)
+    except mysql.connector.Error as e:
+        logger.error(f"Error querying country names: {e}")
+        raise Exception("Could not query the database.")
+    if name is None:
+        logger.warning(f"No country found for code '{country_code}'.")
+        raise ValueError(f"No country found for code '{country_code}'.")
+
+    # Returning the German short name
+    return name
+
+
+@mcp.tool()
+async def get_country_names(country_codes: list[str]) -> dict:
+    """
+    Getting the country names for many country codes in one call.
+
+    Args:
+        country_codes(list[str]): The country codes to look up, e.g. a spreadsheet column.
 
+    Returns:
+        dict: `names` maps every resolved code to its full name in german,
+            `errors` maps every other code to the reason it was not resolved.
+
+    Raises:
+        ValueError: If no or too many country codes are given.
+    """
+    if not country_codes:
+        raise ValueError("Country_codes must be provided.")
+    if len(country_codes) > MAX_BATCH_CODES:
+        raise ValueError(f"At most {MAX_BATCH_CODES} country codes can be looked up at once.")
+
+    # Resolving codes from the in-memory table, the rest with a single `IN` query
+    errors = {code: "Country code must not be empty." for code in country_codes if not code or not code.strip()}
+    codes = {code: normalize_code(code) for code in country_codes if code not in errors}
     try:
-        cursor = conn.cursor(dictionary=True)
-        # Building query dynamically based on provided parameters
-        if country_code :
-            query = """
-                SELECT `ShortName de` FROM stage$iso3166
-                WHERE CODE = %s;
-            """
-            cursor.execute(query, (country_code,))
-        else:
-            raise ValueError("Country_code must be provided.")
-        results = cursor.fetchall()
-        if not results:
-            logger.warning(f"No country found for code '{country_code}'.")
-            raise ValueError(f"No country found for code '{country_code}'.")
-
-        # Returning the German short name from the first row
-        return results[0]["ShortName de"]
-    except Exception as e:
+        found = await countries.lookup_many(list(codes.values()))
+    except mysql.connector.Error as e:
         logger.error(f"Error querying country names: {e}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+        found = {code: countries.get(code) for code in codes.values()}
+        errors.update({code: "Could not query the database." for code, normalized in codes.items()
+                       if found[normalized] is None})
+    names = {code: found[normalized] for code, normalized in codes.items() if found[normalized] is not None}
+    for code in codes:
+        if code not in names and code not in errors:
+            errors[code] = f"No country found for code '{code}'."
+    return {"names": names, "errors": errors}
+
+
+@mcp.tool()
+async def search_country_codes(country_name: str, limit: int = 5) -> dict:
+    """
+    Searching the country codes for a full, partial or misspelled country name in german.
+
+    Args:
+        country_name(str): The country name to search, e.g. "Österreich" or "Vereinigte Staten".
+        limit(int): The maximum number of matches.
+
+    Returns:
+        dict: `matches` holds the `code`, `name` and similarity `score` (0 to 1) of the best matches, best first.
+
+    Raises:
+        ValueError: If no country name is given or the limit is not positive.
+        Exception: For database connection errors while the table is loaded the first time.
+    """
+    if not country_name or not country_name.strip():
+        raise ValueError("Country_name must be provided.")
+    if limit < 1:
+        raise ValueError("Limit must be at least 1.")
+
+    # Loading the table once if the server has not loaded it yet, searches never query the database
+    if countries.loaded_at is None:
+        try:
+            await countries.refresh()
+        except mysql.connector.Error as e:
+            logger.error(f"Error loading country names: {e}")
+            raise Exception("Could not query the database.")
+    return {"matches": countries.index.search(country_name, limit=limit)}
+
+
+@mcp.tool()
+async def refresh_country_names() -> dict:
+    """
+    Reloading the in-memory country table from the database right away.
+
+    Returns:
+        dict: The number of countries loaded and the statistics of the table.
+
+    Raises:
+        Exception: For database connection errors.
+    """
+    try:
+        loaded = await countries.refresh()
+    except mysql.connector.Error as e:
+        logger.error(f"Error loading country names: {e}")
+        raise Exception("Could not query the database.")
+    return {"loaded": loaded, **countries.stats()}
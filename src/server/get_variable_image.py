@@ -2,17 +2,32 @@
 ### MCP server resource for serving a variable image
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
-import os
-import base64
+import json
 from . import mcp
+from .assets import assets, parse_width
 
 @mcp.resource(uri="resource://{image}", name="get_variable_image", description="This offers a variable image file.", mime_type="image/png")
 def get_variable_image(image: str) -> bytes:
     """Variable image file."""
 
-    # Returning a base64-encoded string of the image
-    resource_dir = os.path.join(os.path.dirname(__file__), "../assets")
-    image_path = os.path.join(resource_dir, image)
-    with open(image_path, "rb") as image_file:
-        encoded = base64.b64encode(image_file.read()).decode("utf-8")
-    return encoded
+    # Returning the cached base64-encoded string of the image
+    return assets.get(image)["data"]
+
+
+@mcp.resource(uri="resource://{image}/{width}", name="get_resized_image", description="This offers a variable image file resized to a width in pixels, keeping its aspect ratio.", mime_type="image/png")
+async def get_resized_image(image: str, width: str) -> bytes:
+    """Variable image file resized to `width` pixels."""
+
+    # Returning the cached base64-encoded string of the rendition, resizing it on the first read
+    # Encoding it as PNG whatever the source format, as declared for this resource template
+    rendition = await assets.rendition(image, parse_width(width), "PNG")
+    return rendition["data"]
+
+
+@mcp.resource(uri="etag://{image}", name="get_image_etag", description="This offers the ETag, size and modification time of a variable image file, so clients can skip reading unchanged images.", mime_type="application/json")
+def get_image_etag(image: str) -> str:
+    """ETag of a variable image file."""
+
+    # Returning the content hash of the cached image without its payload
+    entry = assets.get(image)
+    return json.dumps({"etag": entry["etag"], "size": entry["size"], "mtime": entry["mtime"]})
@@ -2,90 +2,449 @@
 ### MCP server tool for image recognition
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
-import streamlit as st
+import asyncio
 import base64
-import io
+import contextlib
 import json
-from PIL import Image as PILImage
-from ollama import AsyncClient
-from openai import AsyncAzureOpenAI
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+from mcp.server.fastmcp import Context
+from mcp.types import ImageContent, TextContent
 from . import mcp
+from .admission import AdmissionLimiter
+from .cache import ResultCache
+from .clients import clients
+from .config import LLM_LOCAL, secrets
+from .imaging import admit_image, create_thumbnail, pixel_allowance
+from .metrics import metrics
+from .minio import get_minio_client, get_object_bytes
+from .phash_index import PerceptualHashIndex
+from .warmup import keep_alive
+from .workers import run_in_process
+logger = logging.getLogger(__name__)
 
-@mcp.tool()
-async def image_recognition(image_bytes: bytes | str) -> str:
-    """Creating an image recognition text and a thumbnail from provided image bytes.
-       Returns a JSON string with keys 'description' and 'image_bytes'."""
+# Setting the default number of concurrent LLM calls for batch recognition
+BATCH_CONCURRENCY = 4
+
+# Setting the default number of LLM calls in flight and waiting across all callers
+LLM_CONCURRENCY = 4
+LLM_QUEUE = 256
+
+# Setting the default thumbnail encoding (format, quality, max edge and size budget)
+THUMBNAIL_FORMAT = "PNG"
+THUMBNAIL_FORMATS = ("PNG", "JPEG", "WEBP", "AUTO")
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_EDGE = 400
+THUMBNAIL_MAX_BYTES = 0
+
+# Setting the default admission budgets of a single image
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50_000_000
+MAX_IMAGE_FRAMES = 100
+IMAGE_FORMATS = "JPEG,MPO,PNG,WEBP,GIF,BMP,TIFF"
+OVERSIZE_POLICY = "reject"
+
+# Setting the cache directory, an empty value keeps caches in memory only
+CACHE_DIR = secrets.get("MCP", {}).get(
+    "MCP_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "../../.cache/image_recognition")
+) or None
+
+# Setting up the content-addressed result cache (memory LRU and disk)
+_cache = ResultCache(
+    max_entries=int(secrets.get("MCP", {}).get("MCP_CACHE_SIZE", 256)),
+    directory=CACHE_DIR,
+)
+
+# Setting up the near-duplicate index reusing descriptions of similar images
+_phash_index = PerceptualHashIndex(
+    max_distance=int(secrets.get("MCP", {}).get("MCP_PHASH_DISTANCE", 16)),
+    path=os.path.join(CACHE_DIR, "phash_index.jsonl") if CACHE_DIR else None,
+)
+
+
+# Setting up the limiter shared by every caller of the LLM, tools, batches and the captioning job alike
+_llm_concurrency = int(secrets.get("MCP", {}).get("MCP_LLM_CONCURRENCY", LLM_CONCURRENCY))
+_llm_limiter = AdmissionLimiter(
+    "llm",
+    max_concurrency=_llm_concurrency,
+    max_queue=int(secrets.get("MCP", {}).get("MCP_LLM_QUEUE", LLM_QUEUE)),
+    kind="backend",
+) if _llm_concurrency > 0 else None
+
+
+def max_image_bytes() -> int:
+    """Returning the byte budget of a single image from the MCP secrets."""
+    return int(secrets.get("MCP", {}).get("MCP_MAX_IMAGE_BYTES", MAX_IMAGE_BYTES))
+
+
+def _check_image_size(size: int) -> None:
+    """Rejecting images over the byte budget before they are read or decoded."""
+    max_bytes = max_image_bytes()
+    if max_bytes and size > max_bytes:
+        raise ValueError(f"Image rejected: {size} bytes exceed the budget of {max_bytes}.")
+
+
+def _pixel_budget() -> tuple[int, str]:
+    """Returning the pixel budget and the oversize policy from the MCP secrets."""
+    mcp_secrets = secrets.get("MCP", {})
+    return (
+        int(mcp_secrets.get("MCP_MAX_IMAGE_PIXELS", MAX_IMAGE_PIXELS)),
+        str(mcp_secrets.get("MCP_OVERSIZE_POLICY", OVERSIZE_POLICY)).lower(),
+    )
+
+
+def _admit(image_bytes: bytes) -> dict:
+    """Checking byte, pixel and frame budgets from the image header only."""
+    _check_image_size(len(image_bytes))
+    mcp_secrets = secrets.get("MCP", {})
+    max_pixels, policy = _pixel_budget()
+    return admit_image(
+        image_bytes,
+        max_pixels=max_pixels,
+        max_frames=int(mcp_secrets.get("MCP_MAX_IMAGE_FRAMES", MAX_IMAGE_FRAMES)),
+        formats=tuple(
+            f.strip().upper()
+            for f in str(mcp_secrets.get("MCP_IMAGE_FORMATS", IMAGE_FORMATS)).split(",")
+            if f.strip()
+        ),
+        policy=policy,
+    )
 
-    # Decoding base64 string if provided, ensure we have raw bytes
+
+def _decode_image_bytes(image_bytes: bytes | str) -> bytes:
+    """Decoding base64 string if provided, ensuring we have raw bytes."""
     if isinstance(image_bytes, str):
-        image_bytes = base64.b64decode(image_bytes)
-    elif not isinstance(image_bytes, (bytes, bytearray)):
+        # Estimating the decoded size so oversized uploads are never decoded
+        _check_image_size(len(image_bytes) * 3 // 4)
+        return base64.b64decode(image_bytes)
+    if not isinstance(image_bytes, (bytes, bytearray)):
         raise ValueError(
             "image_recognition expects bytes or base64 string for image_bytes")
-    img = PILImage.open(io.BytesIO(image_bytes))
-    img.thumbnail((400, 400))
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+    return bytes(image_bytes)
+
+
+def _thumbnail_settings() -> tuple[int, str, int, int]:
+    """Returning max edge, format, quality and byte budget of thumbnails from the MCP secrets.
+
+    Raises:
+        ValueError: If `MCP_THUMBNAIL_FORMAT` is not PNG, JPEG, WEBP or AUTO.
+    """
+    mcp_secrets = secrets.get("MCP", {})
+    image_format = str(mcp_secrets.get("MCP_THUMBNAIL_FORMAT", THUMBNAIL_FORMAT)).upper()
+    if image_format not in THUMBNAIL_FORMATS:
+        raise ValueError(
+            f"MCP_THUMBNAIL_FORMAT must be one of {', '.join(THUMBNAIL_FORMATS)}, not '{image_format}'.")
+    return (
+        int(mcp_secrets.get("MCP_THUMBNAIL_MAX_EDGE", THUMBNAIL_MAX_EDGE)),
+        image_format,
+        int(mcp_secrets.get("MCP_THUMBNAIL_QUALITY", THUMBNAIL_QUALITY)),
+        int(mcp_secrets.get("MCP_THUMBNAIL_MAX_BYTES", THUMBNAIL_MAX_BYTES)),
+    )
+
+
+async def _create_thumbnail(image_bytes: bytes) -> tuple[str, str, dict]:
+    """Creating a thumbnail in the process pool.
+
+    Returns the base64 encoded thumbnail, its MIME type and the perceptual hash signature of the image.
+    """
+    max_edge, image_format, quality, max_bytes = _thumbnail_settings()
+    thumbnail, mime_type, signature = await run_in_process(
+        create_thumbnail, image_bytes, (max_edge, max_edge), image_format, quality, max_bytes, True,
+        pixel_allowance(*_pixel_budget()))
 
     # Encoding Base64 style the thumbnail for JSON transport
-    encoded = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-    # Generating a description for the image through a locally running model via threadpool
-    ollama = st.secrets.get('LLM_LOCAL', "False").lower() == "true"
-    if ollama:
-        # Calling Ollama API
-        async_client = AsyncClient(
-            host=f"{st.secrets['OLLAMA']['OLLAMA_URL']}")
-        resp = await async_client.chat(
-            model=f"{st.secrets['OLLAMA']['OLLAMA_MODEL']}",
+    return base64.b64encode(thumbnail).decode("utf-8"), mime_type, signature
+
+
+def _model_name() -> str:
+    """Returning the backend and model used for descriptions."""
+    if LLM_LOCAL:
+        return f"ollama:{secrets['OLLAMA']['OLLAMA_MODEL']}"
+    return f"azure:{secrets['AZURE_OPENAI']['AZURE_OPENAI_MODEL']}"
+
+
+async def _describe_image(
+    encoded: str,
+    mime_type: str = "image/png",
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> str:
+    """Generating a description for a base64 encoded image through Ollama or Azure OpenAI.
+
+    If `on_token` is given, the backend is called in streaming mode and every
+    text fragment is passed to it as soon as it arrives.
+    """
+    stream = on_token is not None
+    parts = []
+    if LLM_LOCAL:
+        # Calling Ollama API through the pooled client
+        resp = await clients.ollama().chat(
+            model=f"{secrets['OLLAMA']['OLLAMA_MODEL']}",
             messages=[
                 {
                     "role": "system",
-                    "content": f"{st.secrets['MCP']['MCP_SYSTEM_PROMPT']}",
+                    "content": f"{secrets['MCP']['MCP_SYSTEM_PROMPT']}",
                     "role": "user",
-                    "content": f"{st.secrets['MCP']['MCP_USER_PROMPT']}",
+                    "content": f"{secrets['MCP']['MCP_USER_PROMPT']}",
                     "images": [encoded]
                 }
             ],
-            stream=False
+            stream=stream,
+            keep_alive=keep_alive()
         )
-        description = resp.message.content
-    else:
-        # Use Azure OpenAI Studio instead of official OpenAI API
-        azure_openai_secrets = st.secrets['AZURE_OPENAI']
-        client = AsyncAzureOpenAI(
-            api_key=azure_openai_secrets['AZURE_OPENAI_API_KEY'],
-            azure_endpoint=azure_openai_secrets['AZURE_OPENAI_ENDPOINT'],
-            api_version=azure_openai_secrets.get('AZURE_OPENAI_API_VERSION', '2024-02-15-preview')
-        )
-        resp = await client.chat.completions.create(
-            model=azure_openai_secrets['AZURE_OPENAI_MODEL'],
-            messages=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"{st.secrets['MCP']['MCP_SYSTEM_PROMPT']}"
-                        }
-                    ],
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"{st.secrets['MCP']['MCP_USER_PROMPT']}"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded}"
-                            }
+        if not stream:
+            return resp.message.content
+
+        # Forwarding each streamed fragment while collecting the full text
+        async for chunk in resp:
+            if chunk.message.content:
+                parts.append(chunk.message.content)
+                await on_token(chunk.message.content)
+        return "".join(parts)
+
+    # Using Azure OpenAI Studio instead of official OpenAI API through the pooled client
+    resp = await clients.azure_openai().chat.completions.create(
+        model=secrets['AZURE_OPENAI']['AZURE_OPENAI_MODEL'],
+        messages=[
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"{secrets['MCP']['MCP_SYSTEM_PROMPT']}"
+                    }
+                ],
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"{secrets['MCP']['MCP_USER_PROMPT']}"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{encoded}"
                         }
-                    ],
-                }
-            ]
+                    }
+                ],
+            }
+        ],
+        stream=stream
+    )
+    if not stream:
+        return resp.choices[0].message.content
+
+    # Forwarding each streamed fragment while collecting the full text
+    async for chunk in resp:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            await on_token(chunk.choices[0].delta.content)
+    return "".join(parts)
+
+
+async def recognize_image(
+    image_bytes: bytes,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> dict:
+    """Returning description and thumbnail from the cache, a near-duplicate or the LLM."""
+    _admit(image_bytes)
+    context = (
+        _model_name(),
+        secrets['MCP']['MCP_SYSTEM_PROMPT'],
+        secrets['MCP']['MCP_USER_PROMPT'],
+    )
+    key = ResultCache.make_key(image_bytes, *context, *_thumbnail_settings())
+    result = _cache.get(key)
+    if result is None:
+        encoded, mime_type, signature = await _create_thumbnail(image_bytes)
+
+        # Reusing the description of a near-identical image before calling the LLM
+        context_key = ResultCache.make_key(b"", *context)
+        description = _phash_index.find(context_key, signature)
+        if description is None:
+            async with _llm_limiter.slot() if _llm_limiter else contextlib.nullcontext():
+                with metrics.backend("ollama" if LLM_LOCAL else "azure_openai"):
+                    description = await _describe_image(encoded, mime_type, on_token)
+            _phash_index.add(context_key, signature, description)
+        result = {"description": description, "image_bytes": encoded, "mime_type": mime_type}
+        _cache.set(key, result)
+    return result
+
+
+async def _report_progress(ctx: Context, progress: float, total: Optional[float], message: str) -> None:
+    """Sending a progress notification on the stream of the request being served.
+
+    `Context.report_progress` does not name the request, so streamable HTTP would
+    route the notification to the standalone stream, which stateless mode lacks.
+    """
+    meta = ctx.request_context.meta
+    if meta is None or meta.progressToken is None:
+        return
+    await ctx.request_context.session.send_progress_notification(
+        progress_token=meta.progressToken,
+        progress=progress,
+        total=total,
+        message=message,
+        related_request_id=ctx.request_id,
+    )
+
+
+async def _load_image(
+    image_bytes: bytes | str | None = None,
+    object_key: str | None = None,
+    bucket_name: str | None = None,
+    image_uri: str | None = None
+) -> bytes:
+    """Returning raw image bytes from inline data, a MinIO object or an MCP resource."""
+    if image_bytes is not None:
+        return _decode_image_bytes(image_bytes)
+    if object_key:
+        # Fetching the object in a thread as the MinIO client is blocking
+        return await asyncio.to_thread(
+            get_object_bytes,
+            get_minio_client(),
+            bucket_name or secrets["MinIO"]["bucket"],
+            object_key,
+            max_image_bytes()
         )
-        description = resp.choices[0].message.content
-    # Returning a JSON object with description and base64 image for JSON transport
-    return json.dumps({"description": description, "image_bytes": encoded})
+    if image_uri:
+        # Reading one of this server's resources, which hold base64 text or raw bytes
+        contents = list(await mcp.read_resource(image_uri))
+        if not contents:
+            raise ValueError(f"Resource '{image_uri}' is empty.")
+        return _decode_image_bytes(contents[0].content)
+    raise ValueError("One of image_bytes, object_key or image_uri must be provided.")
+
+
+@mcp.tool()
+async def image_recognition(
+    image_bytes: bytes | str | None = None,
+    object_key: str | None = None,
+    bucket_name: str | None = None,
+    image_uri: str | None = None,
+    stream: bool = False,
+    ctx: Context = None
+) -> list[TextContent | ImageContent]:
+    """
+    Creating an image recognition text and a thumbnail from an image.
+
+    Args:
+        image_bytes(bytes | str): Inline image bytes or base64 string.
+        object_key(str): MinIO object key of the image, instead of uploading it.
+        bucket_name(str): MinIO bucket holding `object_key`, defaults to the configured bucket.
+        image_uri(str): Resource URI of the image on this server, e.g. `resource://Image.png`.
+        stream(bool): Sending description fragments as progress notification messages.
+
+    Returns:
+        list: A text content block with the description and an image content block
+              with the thumbnail, encoded as configured by `MCP_THUMBNAIL_FORMAT`.
+    """
+    on_token = None
+    if stream and ctx is not None:
+        received = 0
+
+        # Sending every fragment as message of a progress notification
+        async def on_token(fragment: str) -> None:
+            nonlocal received
+            received += 1
+            await _report_progress(ctx, received, None, fragment)
+
+    image = await _load_image(image_bytes, object_key, bucket_name, image_uri)
+    result = await recognize_image(image, on_token)
+
+    # Returning native MCP content blocks instead of base64 inside a JSON string
+    return [
+        TextContent(type="text", text=result["description"]),
+        ImageContent(type="image", data=result["image_bytes"], mimeType=result["mime_type"]),
+    ]
+
+
+@mcp.tool()
+async def image_recognition_batch(
+    images: list[str] | None = None,
+    object_keys: list[str] | None = None,
+    bucket_name: str | None = None,
+    max_concurrency: int | None = None,
+    include_thumbnails: bool = True,
+    ctx: Context = None,
+) -> list[TextContent | ImageContent]:
+    """
+    Creating image recognition texts and thumbnails for many images at once.
+
+    Args:
+        images(list[str]): Base64 encoded images to describe.
+        object_keys(list[str]): MinIO object keys of images to describe.
+        bucket_name(str): MinIO bucket holding `object_keys`, defaults to the configured bucket.
+        max_concurrency(int): Upper bound of concurrent LLM calls, capped by the server setting.
+        include_thumbnails(bool): Returning the thumbnails as image content blocks.
+
+    Returns:
+        list: A text content block with a JSON string with key 'results', a list in
+              completion order where every entry holds 'index', 'source' and either
+              'description' and 'mime_type' or 'error', followed by an image content block
+              with the thumbnail of every entry without error, in the same order. Each
+              finished entry is also sent as a progress notification.
+    """
+    sources = [("inline", image) for image in images or []]
+    sources += [("minio", key) for key in object_keys or []]
+    if not sources:
+        raise ValueError("Either images or object_keys must be provided.")
+
+    # Limiting the fan-out to what the server allows
+    server_limit = int(secrets.get("MCP", {}).get(
+        "MCP_BATCH_CONCURRENCY", BATCH_CONCURRENCY))
+    limit = max(1, min(max_concurrency or server_limit, server_limit))
+    semaphore = asyncio.Semaphore(limit)
+
+    minio_client = None
+    if object_keys:
+        minio_client = get_minio_client()
+        bucket_name = bucket_name or secrets["MinIO"]["bucket"]
+
+    async def _recognize(index: int, kind: str, item: str) -> dict:
+        source = item if kind == "minio" else f"images[{index}]"
+        try:
+            async with semaphore:
+                if kind == "minio":
+                    image_bytes = await asyncio.to_thread(
+                        get_object_bytes, minio_client, bucket_name, item, max_image_bytes())
+                else:
+                    image_bytes = _decode_image_bytes(item)
+                result = await recognize_image(image_bytes)
+            return {"index": index, "source": source, **result}
+        except Exception as e:
+            logger.error(f"Image recognition failed for {source}: {e}")
+            return {"index": index, "source": source, "error": str(e)}
+
+    # Collecting results as they finish and reporting each one right away
+    tasks = [
+        asyncio.create_task(_recognize(index, kind, item))
+        for index, (kind, item) in enumerate(sources)
+    ]
+    results = []
+    thumbnails = []
+    for finished in asyncio.as_completed(tasks):
+        result = await finished
+        if "image_bytes" in result:
+            thumbnails.append(ImageContent(
+                type="image", data=result.pop("image_bytes"), mimeType=result["mime_type"]))
+        results.append(result)
+        if ctx is not None:
+            await _report_progress(ctx, len(results), len(tasks), json.dumps(result))
+
+    # Returning the thumbnails as native image blocks instead of base64 inside the JSON text
+    content: list[TextContent | ImageContent] = [TextContent(type="text", text=json.dumps({"results": results}))]
+    return content + thumbnails if include_thumbnails else content
+
+
+def recognition_stats() -> dict:
+    """Returning the statistics of the result cache, the near-duplicate index and the LLM limiter."""
+    llm = {"max_concurrency": 0, "running": 0, "waiting": 0}
+    if _llm_limiter is not None:
+        llm = {
+            "max_concurrency": _llm_limiter.max_concurrency,
+            "running": _llm_limiter.running,
+            "waiting": _llm_limiter.waiting,
+        }
+    return {"cache": _cache.stats(), "near_duplicates": _phash_index.stats(), "llm": llm}
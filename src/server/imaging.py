@@ -0,0 +1,345 @@
+### `src/server/imaging.py`
+### CPU-bound image helpers for MCP server tools
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import io
+import math
+import threading
+from typing import Optional
+from PIL import Image as PILImage, ImageChops, ImageFilter
+
+# Functions in this module run inside worker processes, so they only take
+# and return picklable values and never touch Streamlit or the event loop.
+
+# Setting how much larger than the target the decoded image must stay
+REDUCING_GAP = 2.0
+
+# Setting the smallest JPEG draft scale (1/8 per edge) used to decode oversized images
+DRAFT_PIXEL_FACTOR = 64
+
+# Setting the formats with JPEG-coded frames, multi-picture (MPO) files included
+JPEG_FORMATS = ("JPEG", "MPO")
+
+# Guarding Pillow's process-wide decompression bomb limit while an open raises it
+_pixel_limit_lock = threading.Lock()
+
+# Setting the edge of the difference hash (256 bits) and of the DCT input of the pHash
+DHASH_SIZE = 16
+PHASH_SIZE = 32
+
+# Setting the grey-level difference below which neighbouring hash pixels count as flat
+FLAT_TOLERANCE = 2
+
+# Setting the grey-level distance to the background counted as content, above JPEG ringing
+CONTENT_CONTRAST = 96
+
+# Setting the cells along the longer side of the content grid of low-detail images
+CONTENT_CELLS = 64
+
+
+def pixel_allowance(max_pixels: int, policy: str = "reject") -> int:
+    """Returning the most pixels an admitted image may have, 0 for no budget."""
+    return max_pixels * DRAFT_PIXEL_FACTOR if policy == "downscale" else max_pixels
+
+
+def open_image(image_bytes: bytes, max_pixels: int = 0) -> PILImage.Image:
+    """Opening an image lazily, raising Pillow's decompression bomb limit to `max_pixels`.
+
+    Pillow warns about images above `MAX_IMAGE_PIXELS` (about 89 MP) and refuses
+    those above twice as many, well below what the `downscale` policy admits.
+    The pixel budget checked by `admit_image` takes its place for these opens.
+    """
+    with _pixel_limit_lock:
+        limit = PILImage.MAX_IMAGE_PIXELS
+        if limit is not None and max_pixels > limit:
+            PILImage.MAX_IMAGE_PIXELS = max_pixels
+        try:
+            return PILImage.open(io.BytesIO(image_bytes))
+        finally:
+            PILImage.MAX_IMAGE_PIXELS = limit
+
+
+def admit_image(
+    image_bytes: bytes,
+    max_pixels: int,
+    max_frames: int,
+    formats: tuple[str, ...],
+    policy: str = "reject"
+) -> dict:
+    """Checking an image against the admission budgets by reading its header only.
+
+    No pixel data is decoded, so this is cheap enough to run on the event loop.
+
+    Args:
+        image_bytes: The encoded image.
+        max_pixels: The pixel budget of a decode, 0 for none.
+        max_frames: The maximum number of frames (pages, animation frames), 0 for none.
+        formats: The accepted Pillow format names.
+        policy: `reject` refuses images over the pixel budget, `downscale` admits
+            JPEGs (and MPOs) which fit the budget when decoded at reduced scale.
+
+    Returns:
+        dict: Format, width, height and frames of the image.
+
+    Raises:
+        ValueError: If the image is unreadable or outside the budgets.
+    """
+    try:
+        img = open_image(image_bytes, pixel_allowance(max_pixels, policy))
+    except PILImage.DecompressionBombError as e:
+        raise ValueError(f"Image rejected: {e}")
+    except Exception:
+        raise ValueError("Image rejected: not a readable image.")
+    info = {
+        "format": img.format,
+        "width": img.width,
+        "height": img.height,
+        "frames": getattr(img, "n_frames", 1),
+    }
+    if formats and img.format not in formats:
+        raise ValueError(f"Image rejected: format {img.format} is not accepted.")
+    if max_frames and info["frames"] > max_frames:
+        raise ValueError(
+            f"Image rejected: {info['frames']} frames exceed the limit of {max_frames}.")
+    pixels = img.width * img.height
+    if max_pixels and pixels > max_pixels:
+        reducible = policy == "downscale" and img.format in JPEG_FORMATS
+        if not reducible or pixels // DRAFT_PIXEL_FACTOR > max_pixels:
+            raise ValueError(
+                f"Image rejected: {img.width}x{img.height} pixels exceed the budget of {max_pixels}.")
+    return info
+
+
+def _fit_size(source: tuple[int, int], size: tuple[int, int]) -> tuple[int, int]:
+    """Returning the aspect-preserving size of `source` which fits into `size`."""
+    scale = min(size[0] / source[0], size[1] / source[1], 1.0)
+    return max(1, round(source[0] * scale)), max(1, round(source[1] * scale))
+
+
+def decode_reduced(image_bytes: bytes, size: tuple[int, int], max_pixels: int = 0) -> PILImage.Image:
+    """Decoding an image at the smallest scale which still covers `size`.
+
+    JPEGs and MPOs are decoded directly at 1/2, 1/4 or 1/8 scale (draft mode), so the
+    full-resolution bitmap never exists in memory. Other formats are fully
+    decoded and then shrunk by an integer `reduce` factor, which is much
+    cheaper than resampling the whole bitmap. `max_pixels` is the
+    `pixel_allowance` the image was admitted with.
+    """
+    img = open_image(image_bytes, max_pixels)
+    fit = _fit_size(img.size, size)
+    target = (int(fit[0] * REDUCING_GAP), int(fit[1] * REDUCING_GAP))
+
+    # Decoding JPEGs at reduced DCT scale when the source is much larger
+    if img.format in JPEG_FORMATS and img.width >= 2 * target[0] and img.height >= 2 * target[1]:
+        img.draft(None, target)
+    img.load()
+
+    # Falling back to an integer box reduction after a full decode
+    factor = min(img.width // target[0], img.height // target[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+def _encode(img: PILImage.Image, image_format: str, quality: int) -> bytes:
+    """Encoding an image as PNG, JPEG or WEBP."""
+    if image_format == "JPEG":
+        # Flattening transparency onto white as JPEG has no alpha channel
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            img = PILImage.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+    elif image_format == "WEBP" and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buffer, format="PNG")
+    else:
+        img.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _hash_pixels(img: PILImage.Image, hash_size: int) -> list[int]:
+    """Shrinking an image to (hash_size + 1) x hash_size grey pixels."""
+    grey = img.convert("L").resize((hash_size + 1, hash_size), PILImage.Resampling.BOX)
+    return list(grey.tobytes())
+
+
+def difference_hash(img: PILImage.Image, hash_size: int = DHASH_SIZE) -> int:
+    """Computing a perceptual difference hash (dHash) with `hash_size` squared bits.
+
+    The image is shrunk to (hash_size + 1) x hash_size grey pixels and each bit
+    tells whether a pixel is brighter than its right neighbour, so re-exports,
+    rescales and recompressions of an image end up only a few bits apart.
+    """
+    pixels = _hash_pixels(img, hash_size)
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def dct_hash(img: PILImage.Image) -> int:
+    """Computing a 64-bit perceptual hash (pHash) from the lowest 8 x 8 DCT frequencies.
+
+    Each bit tells whether a frequency is above the median of the others, so
+    the hash follows the overall layout of an image rather than its edges.
+    """
+    size = PHASH_SIZE
+    pixels = list(img.convert("L").resize((size, size), PILImage.Resampling.LANCZOS).tobytes())
+    cosines = [[math.cos(math.pi * (2 * x + 1) * u / (2 * size)) for x in range(size)] for u in range(8)]
+
+    # Transforming rows first and columns second, keeping the 8 x 8 lowest frequencies only
+    rows = [
+        [sum(pixels[y * size + x] * cosines[u][x] for x in range(size)) for u in range(8)]
+        for y in range(size)
+    ]
+    coefficients = [sum(rows[y][u] * cosines[v][y] for y in range(size)) for v in range(8) for u in range(8)]
+    median = sorted(coefficients[1:])[31]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def hash_detail(img: PILImage.Image, hash_size: int = DHASH_SIZE) -> float:
+    """Returning the share of difference hash bits taken from neighbours which actually differ.
+
+    Mostly blank images, like text on a white slide, have hash pixels of equal
+    brightness almost everywhere. Their hash bits carry no information, so two
+    different slides of this kind hash alike.
+    """
+    pixels = _hash_pixels(img, hash_size)
+    flat = sum(
+        abs(pixels[row * (hash_size + 1) + col] - pixels[row * (hash_size + 1) + col + 1]) <= FLAT_TOLERANCE
+        for row in range(hash_size) for col in range(hash_size)
+    )
+    return 1 - flat / (hash_size * hash_size)
+
+
+def content_grid(img: PILImage.Image) -> Optional[dict]:
+    """Returning the ink grid of the content bounding box of an image, None for blank images.
+
+    Slides keep their information in thin strokes on a flat background. The
+    box around everything far enough from the background colour is cropped,
+    so re-exports, rescales and trimmed margins share one grid, and sampled
+    with `CONTENT_CELLS` cells along its longer side, fine enough to tell one
+    slide title from another.
+    """
+    grey = img.convert("L")
+    histogram = grey.histogram()
+    ink = ImageChops.difference(grey, PILImage.new("L", grey.size, histogram.index(max(histogram))))
+    box = ink.point(lambda value: 255 if value > CONTENT_CONTRAST else 0).getbbox()
+    if box is None:
+        return None
+    aspect = (box[2] - box[0]) / (box[3] - box[1])
+    if aspect >= 1:
+        size = (CONTENT_CELLS, max(4, round(CONTENT_CELLS / aspect)))
+    else:
+        size = (max(4, round(CONTENT_CELLS * aspect)), CONTENT_CELLS)
+    grid = ink.crop(box).resize(size, PILImage.Resampling.BOX).filter(ImageFilter.GaussianBlur(0.7))
+
+    # Stretching the grid to full contrast, so grey text on grey matches black on white
+    peak = grid.getextrema()[1] or 1
+    grid = grid.point(lambda value: value * 255 // peak)
+    return {"size": size, "aspect": aspect, "cells": grid.tobytes()}
+
+
+def content_distance(first: dict, second: dict) -> int:
+    """Returning the largest cell difference of two content grids, the second resampled to the first."""
+    cells = second["cells"]
+    if tuple(second["size"]) != tuple(first["size"]):
+        grid = PILImage.frombytes("L", tuple(second["size"]), cells)
+        cells = grid.resize(tuple(first["size"]), PILImage.Resampling.BILINEAR).tobytes()
+    return max(abs(left - right) for left, right in zip(first["cells"], cells))
+
+
+def image_signature(img: PILImage.Image) -> dict:
+    """Returning the difference hash, pHash, aspect ratio, detail and content grid of an image for near-duplicate lookups."""
+    return {
+        "dhash": difference_hash(img),
+        "phash": dct_hash(img),
+        "aspect": img.width / img.height,
+        "detail": hash_detail(img),
+        "content": content_grid(img),
+    }
+
+
+def create_thumbnail(
+    image_bytes: bytes,
+    size: tuple[int, int] = (400, 400),
+    image_format: str = "PNG",
+    quality: int = 80,
+    max_bytes: int = 0,
+    with_hash: bool = False,
+    max_pixels: int = 0
+) -> tuple[bytes, str] | tuple[bytes, str, dict]:
+    """Creating a thumbnail which fits into `size` from encoded image bytes.
+
+    Args:
+        image_bytes: The encoded source image.
+        size: The bounding box of the thumbnail.
+        image_format: PNG, JPEG, WEBP or AUTO, which tries JPEG and WEBP.
+        quality: The starting quality of lossy encodings.
+        max_bytes: The size budget, 0 for none. Lossy encodings step their
+            quality down until the smallest candidate fits the budget.
+        with_hash: Also returning the `image_signature` of the decoded image.
+        max_pixels: The `pixel_allowance` the image was admitted with, 0 for
+            Pillow's own limit.
+
+    Returns:
+        The encoded thumbnail and its MIME type, plus the signature if requested.
+    """
+    img = decode_reduced(image_bytes, size, max_pixels)
+
+    # Hashing before shrinking, the content grid of slides needs more than thumbnail resolution
+    signature = image_signature(img) if with_hash else None
+    img.thumbnail(size)
+    image_format = image_format.upper()
+    formats = ["JPEG", "WEBP"] if image_format == "AUTO" else [image_format]
+
+    # Stepping quality down until the smallest encoding fits the budget
+    best = None
+    qualities = [quality] if image_format == "PNG" else [quality, *range(quality - 10, 29, -10)]
+    for step in qualities:
+        candidates = [(_encode(img, fmt, step), fmt) for fmt in formats]
+        smallest = min(candidates, key=lambda candidate: len(candidate[0]))
+        if best is None or len(smallest[0]) < len(best[0]):
+            best = smallest
+        if not max_bytes or len(smallest[0]) <= max_bytes:
+            best = smallest
+            break
+    if with_hash:
+        return best[0], PILImage.MIME[best[1]], signature
+    return best[0], PILImage.MIME[best[1]]
+
+
+def resize_to_width(image_bytes: bytes, width: int, image_format: Optional[str] = None) -> tuple[bytes, str]:
+    """Resizing an image to `width` pixels, keeping its aspect ratio and, where possible, its format.
+
+    Images which are not wider than `width` are returned unchanged, so
+    renditions never upscale.
+
+    Args:
+        image_bytes: The encoded source image.
+        width: The width of the rendition in pixels.
+        image_format: PNG, JPEG or WEBP, None for the format of the source
+            where possible and PNG otherwise.
+
+    Returns:
+        The encoded image and its MIME type.
+    """
+    img = PILImage.open(io.BytesIO(image_bytes))
+    if image_format is None:
+        image_format = img.format if img.format in ("PNG", "JPEG", "WEBP") else "PNG"
+    if img.width <= width and image_format == img.format:
+        return image_bytes, PILImage.MIME[image_format]
+    height = max(1, round(img.height * min(width, img.width) / img.width))
+    size = (min(width, img.width), height)
+    img = decode_reduced(image_bytes, size).resize(size, PILImage.Resampling.LANCZOS)
+    return _encode(img, image_format, 90), PILImage.MIME[image_format]
@@ -0,0 +1,174 @@
+### `src/server/lazy_tools.py`
+### Lazy registration of MCP tools from a lightweight manifest
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import argparse
+import asyncio
+import importlib
+import inspect
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, Optional
+from mcp.server.fastmcp.tools import Tool
+from mcp.server.fastmcp.utilities.func_metadata import func_metadata
+logger = logging.getLogger(__name__)
+
+# Setting the manifest holding the schemas of all lazily loaded tools
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "tools.json")
+
+# Setting the tool modules which are imported on the first call of one of their tools
+LAZY_MODULES = ("image_recognition", "get_country_name")
+
+# Collecting the import time of every lazily loaded module
+import_seconds: dict[str, float] = {}
+_module_locks: dict[str, asyncio.Lock] = {}
+
+
+def import_tool_module(module: str) -> Any:
+    """Importing a tool module of this package and recording how long it took."""
+    start = time.perf_counter()
+    imported = importlib.import_module(f".{module}", __package__)
+    import_seconds.setdefault(module, time.perf_counter() - start)
+    return imported
+
+
+def _no_arguments() -> None:
+    pass
+
+
+# Creating the `LazyTool` class
+class LazyTool(Tool):
+    """Tool registered from its manifest entry whose module is imported on the first call.
+
+    The advertised schema comes from the manifest. Arguments are validated against
+    the real function signature once the module is loaded.
+    """
+
+    module: str
+    function: str
+    target: Optional[Callable[..., Any]] = None
+
+    @classmethod
+    def from_manifest(cls, entry: dict) -> "LazyTool":
+        """Creating a placeholder tool from a manifest entry."""
+        tool = cls(
+            fn=_no_arguments,
+            name=entry["name"],
+            description=entry["description"],
+            parameters=entry["parameters"],
+            fn_metadata=func_metadata(_no_arguments),
+            is_async=True,
+            context_kwarg=entry.get("context_kwarg"),
+            module=entry["module"],
+            function=entry["function"],
+        )
+
+        # Calling the implementation through a stable proxy, so wrappers like coalescing apply to it
+        async def _call(**kwargs: Any) -> Any:
+            result = tool.target(**kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+        tool.fn = _call
+        return tool
+
+    async def load(self) -> None:
+        """Importing the module off the event loop and binding the real function."""
+        lock = _module_locks.setdefault(self.module, asyncio.Lock())
+        async with lock:
+            if self.target is not None:
+                return
+            module = await asyncio.to_thread(import_tool_module, self.module)
+            target = getattr(module, self.function)
+            real = Tool.from_function(target, name=self.name)
+            if real.parameters != self.parameters:
+                logger.warning(
+                    f"Manifest schema of tool {self.name} is stale, "
+                    f"regenerate it with `python -m server.lazy_tools --write`.")
+            self.fn_metadata = real.fn_metadata
+            self.target = target
+            logger.info(f"Loaded tool module {self.module} in {import_seconds[self.module]:.2f}s.")
+
+    async def run(self, arguments: dict[str, Any], context: Any = None) -> Any:
+        """Loading the implementation if needed and running the tool."""
+        if self.target is None:
+            await self.load()
+        return await super().run(arguments, context=context)
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> list[dict]:
+    """Reading the tool manifest."""
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)["tools"]
+
+
+def register_lazy_tools(mcp, path: str = MANIFEST_PATH) -> list[LazyTool]:
+    """Registering every tool of the manifest on a FastMCP server without importing its module.
+
+    Falls back to importing the tool modules right away if there is no manifest.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"No tool manifest at {path}, importing the tool modules eagerly.")
+        for module in LAZY_MODULES:
+            import_tool_module(module)
+        return []
+    tools = []
+    for entry in load_manifest(path):
+        tool = LazyTool.from_manifest(entry)
+        mcp._tool_manager._tools[tool.name] = tool
+        tools.append(tool)
+    return tools
+
+
+def build_manifest(mcp, modules: tuple[str, ...] = LAZY_MODULES) -> dict:
+    """Importing the tool modules into an empty registry and collecting the schemas of their tools."""
+    registered = mcp._tool_manager._tools
+    mcp._tool_manager._tools = {}
+    try:
+        for module in modules:
+            name = f"{__package__}.{module}"
+            if name in sys.modules:
+                importlib.reload(sys.modules[name])
+            else:
+                import_tool_module(module)
+        tools = mcp._tool_manager.list_tools()
+    finally:
+        mcp._tool_manager._tools = registered
+    return {"tools": sorted((
+        {
+            "name": tool.name,
+            "module": tool.fn.__module__.rsplit(".", 1)[-1],
+            "function": tool.fn.__name__,
+            "description": tool.description,
+            "parameters": tool.parameters,
+            "context_kwarg": tool.context_kwarg,
+        }
+        for tool in tools
+    ), key=lambda entry: entry["name"])}
+
+
+def main() -> None:
+    """Writing or checking the tool manifest from the command line."""
+    parser = argparse.ArgumentParser(description="Generate the manifest of lazily loaded MCP tools")
+    parser.add_argument("--write", action="store_true", help="Write the manifest instead of checking it")
+    args = parser.parse_args()
+
+    from . import mcp
+    manifest = build_manifest(mcp)
+    if args.write:
+        with open(MANIFEST_PATH, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+            manifest_file.write("\n")
+        print(f"Wrote {len(manifest['tools'])} tools to {MANIFEST_PATH}.")
+        return
+    if manifest["tools"] != load_manifest():
+        raise SystemExit(f"{MANIFEST_PATH} is stale, run with --write.")
+    print(f"{MANIFEST_PATH} is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+### `src/server/metrics.py`
+### Per-handler call, error, in-flight and latency metrics in Prometheus text format
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Iterator, Optional
+logger = logging.getLogger(__name__)
+
+# Setting the latency buckets in seconds, extended for slow LLM calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Holding the backend and wait seconds of the handler call running in the current context
+_handler_seconds: contextvars.ContextVar[Optional[list[float]]] = contextvars.ContextVar(
+    "handler_seconds", default=None)
+
+
+# Creating the `Histogram` class
+class Histogram:
+    """Cumulative latency histogram with Prometheus bucket semantics."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[tuple[str, int]]:
+        """Yielding the `le` label and cumulative count of every bucket including `+Inf`."""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+# Creating the `Metrics` class
+class Metrics:
+    """Collecting handler and backend metrics of one server process.
+
+    Every handler call records its total latency, the time spent waiting on
+    backends (LLMs, MinIO, databases), the time spent waiting for an admission
+    slot, a worker process or a coalesced call of another caller, and the
+    remaining local time. Backend time of concurrent calls inside one handler,
+    e.g. a batch, is summed.
+
+    Example:
+        .. code-block:: python
+
+            with metrics.backend("ollama"):
+                resp = await clients.ollama().chat(...)
+            text = metrics.render()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: dict[tuple[str, str], int] = defaultdict(int)
+        self.errors: dict[tuple[str, str], int] = defaultdict(int)
+        self.in_flight: dict[tuple[str, str], int] = defaultdict(int)
+        self.waiting: dict[tuple[str, str], int] = defaultdict(int)
+        self.rejected: dict[tuple[str, str], int] = defaultdict(int)
+        self.queue: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.latency: dict[tuple[str, str, str], Histogram] = defaultdict(Histogram)
+        self.backends: dict[str, Histogram] = defaultdict(Histogram)
+
+    @contextlib.contextmanager
+    def backend(self, name: str) -> Iterator[None]:
+        """Timing a backend call and adding it to the backend time of the current handler."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.backends[name].observe(elapsed)
+            accumulated = _handler_seconds.get()
+            if accumulated is not None:
+                accumulated[0] += elapsed
+
+    def add_wait(self, seconds: float) -> None:
+        """Adding time spent waiting for a slot, a worker or another call to the wait time of the current handler."""
+        accumulated = _handler_seconds.get()
+        if accumulated is not None:
+            accumulated[1] += seconds
+
+    def queue_enter(self, kind: str, name: str) -> None:
+        """Counting a call which starts waiting for admission."""
+        with self._lock:
+            self.waiting[(kind, name)] += 1
+
+    def queue_exit(self, kind: str, name: str, seconds: float) -> None:
+        """Recording how long a call waited for admission."""
+        with self._lock:
+            self.waiting[(kind, name)] -= 1
+            self.queue[(kind, name)].observe(seconds)
+        self.add_wait(seconds)
+
+    def reject(self, kind: str, name: str) -> None:
+        """Counting a call rejected by admission control."""
+        with self._lock:
+            self.rejected[(kind, name)] += 1
+
+    def instrument(self, kind: str, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrapping a handler function, returning an async function with the same name."""
+        key = (kind, name)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            accumulated = [0.0, 0.0]
+            token = _handler_seconds.set(accumulated)
+            with self._lock:
+                self.calls[key] += 1
+                self.in_flight[key] += 1
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+            except Exception:
+                with self._lock:
+                    self.errors[key] += 1
+                raise
+            finally:
+                total = time.perf_counter() - start
+                backend = min(accumulated[0], total)
+                wait = min(accumulated[1], total - backend)
+                with self._lock:
+                    self.in_flight[key] -= 1
+                    self.latency[(kind, name, "total")].observe(total)
+                    self.latency[(kind, name, "backend")].observe(backend)
+                    self.latency[(kind, name, "wait")].observe(wait)
+                    self.latency[(kind, name, "local")].observe(total - backend - wait)
+                _handler_seconds.reset(token)
+        return wrapper
+
+    def render(self) -> str:
+        """Rendering all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, help_text, values in (
+                ("mcp_handler_calls_total", "Calls of MCP tool, resource and prompt handlers.", self.calls),
+                ("mcp_handler_errors_total", "Calls of MCP handlers which raised an error.", self.errors),
+                ("mcp_handler_in_flight", "MCP handler calls currently running.", self.in_flight),
+                ("mcp_handler_waiting", "MCP handler calls waiting for admission.", self.waiting),
+                ("mcp_handler_rejected_total", "MCP handler calls rejected as busy.", self.rejected),
+            ):
+                metric_type = "counter" if metric.endswith("_total") else "gauge"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+                for (kind, name), value in sorted(values.items()):
+                    lines.append(f"{metric}{_labels(kind=kind, name=name)} {value}")
+
+            lines += [
+                "# HELP mcp_handler_seconds Latency of MCP handlers, split into backend, wait and local time.",
+                "# TYPE mcp_handler_seconds histogram",
+            ]
+            for (kind, name, part), histogram in sorted(self.latency.items()):
+                lines += _histogram_lines("mcp_handler_seconds", histogram, kind=kind, name=name, part=part)
+
+            lines += [
+                "# HELP mcp_handler_queue_seconds Time MCP handler calls waited for admission.",
+                "# TYPE mcp_handler_queue_seconds histogram",
+            ]
+            for (kind, name), histogram in sorted(self.queue.items()):
+                lines += _histogram_lines("mcp_handler_queue_seconds", histogram, kind=kind, name=name)
+
+            lines += [
+                "# HELP mcp_backend_seconds Latency of backend calls.",
+                "# TYPE mcp_backend_seconds histogram",
+            ]
+            for backend, histogram in sorted(self.backends.items()):
+                lines += _histogram_lines("mcp_backend_seconds", histogram, backend=backend)
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(metric: str, histogram: Histogram, **labels: str) -> list[str]:
+    lines = [
+        f"{metric}_bucket{_labels(**labels, le=le)} {count}"
+        for le, count in histogram.cumulative()
+    ]
+    lines.append(f"{metric}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{metric}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def instrument_handlers(mcp, registry: Optional[Metrics] = None) -> None:
+    """Wrapping every registered tool, resource, resource template and prompt of a FastMCP server."""
+    registry = registry or metrics
+    for tool in mcp._tool_manager.list_tools():
+        tool.fn = registry.instrument("tool", tool.name, tool.fn)
+        tool.is_async = True
+    for resource in mcp._resource_manager._resources.values():
+        if hasattr(resource, "fn"):
+            resource.fn = registry.instrument("resource", str(resource.uri), resource.fn)
+    for template in mcp._resource_manager._templates.values():
+        template.fn = registry.instrument("resource", template.uri_template, template.fn)
+    for prompt in mcp._prompt_manager._prompts.values():
+        prompt.fn = registry.instrument("prompt", prompt.name, prompt.fn)
+
+
+# Creating the metrics shared by the server process
+metrics = Metrics()
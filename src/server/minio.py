@@ -2,24 +2,30 @@
 ### Embedding class for Snowflake
 ### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
 ### Please reach out to ben@seriousbenentertainment.org for any questions
-import streamlit as st
 import logging
 from minio import Minio
 from minio.error import S3Error
+from .config import secrets
+from .metrics import metrics
 logger = logging.getLogger(__name__)
 
-# Setting up MinIO client from Streamlit secrets
+# Setting up MinIO client from the server configuration
 def get_minio_client():
-    """Creating and returning a MinIO client using Streamlit secrets."""
+    """Creating and returning a MinIO client using the server configuration."""
     return Minio(
-        endpoint=st.secrets["MinIO"]["endpoint"].replace("http://", ""),
-        access_key=st.secrets["MinIO"]["access_key"],
-        secret_key=st.secrets["MinIO"]["secret_key"],
+        endpoint=secrets["MinIO"]["endpoint"].replace("http://", ""),
+        access_key=secrets["MinIO"]["access_key"],
+        secret_key=secrets["MinIO"]["secret_key"],
         secure=False
     )
 
 # Function to list buckets
 def list_buckets(minio_client):
+    """Returning the names of all buckets.
+
+    Raises:
+        S3Error: If the buckets cannot be listed.
+    """
     try:
         buckets = minio_client.list_buckets()
         # Returning bucket names as lowercase and hyphenated for MinIO compatibility
@@ -28,11 +34,16 @@ def list_buckets(minio_client):
             for bucket in buckets
         ]
     except S3Error as e:
-        st.error(f"Error: {e}")
-    return
+        logger.error(f"Error listing buckets: {e}")
+        raise
 
 # Function to list objects in a bucket
 def list_objects(minio_client, bucket_name):
+    """Returning the names of all objects of a bucket.
+
+    Raises:
+        S3Error: If the bucket cannot be listed.
+    """
     # Ensuring bucket_name is lowercase and hyphenated for MinIO
     bucket_name = bucket_name.lower().replace(' ', '-')
     try:
@@ -42,5 +53,50 @@ def list_objects(minio_client, bucket_name):
             for obj in objects
         ]
     except S3Error as e:
-        st.error(f"Error: {e}")
-    return
+        logger.error(f"Error listing objects of {bucket_name}: {e}")
+        raise
+
+# Function to stream objects of a bucket
+def iter_objects(minio_client, bucket_name, prefix=None, start_after=None):
+    """Yielding object names of a bucket in lexicographic order without holding the listing.
+
+    Args:
+        prefix: Only listing objects below this prefix.
+        start_after: Only listing objects after this key, e.g. to resume a job.
+    """
+    # Ensuring bucket_name is lowercase and hyphenated for MinIO
+    bucket_name = bucket_name.lower().replace(' ', '-')
+    for obj in minio_client.list_objects(
+        bucket_name, prefix=prefix, recursive=True, start_after=start_after
+    ):
+        if not obj.is_dir:
+            yield obj.object_name
+
+# Function to read an object into memory
+def get_object_bytes(minio_client, bucket_name, object_name, max_bytes=0):
+    """Reading a whole object from a bucket and returning its bytes.
+
+    Raises:
+        S3Error: If the object cannot be read.
+        ValueError: If the object is larger than `max_bytes` (0 for no limit).
+    """
+    # Ensuring bucket_name is lowercase and hyphenated for MinIO
+    bucket_name = bucket_name.lower().replace(' ', '-')
+    response = None
+    try:
+        with metrics.backend("minio"):
+            # Checking the object size from its metadata before downloading it
+            if max_bytes:
+                size = minio_client.stat_object(bucket_name, object_name).size
+                if size > max_bytes:
+                    raise ValueError(
+                        f"Object {object_name} rejected: {size} bytes exceed the budget of {max_bytes}.")
+            response = minio_client.get_object(bucket_name, object_name)
+            return response.read()
+    except S3Error as e:
+        logger.error(f"Error reading object {object_name} from {bucket_name}: {e}")
+        raise
+    finally:
+        if response is not None:
+            response.close()
+            response.release_conn()
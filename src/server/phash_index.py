@@ -0,0 +1,242 @@
+### `src/server/phash_index.py`
+### Perceptual-hash index for near-duplicate image lookups
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import base64
+import bisect
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+from .imaging import content_distance
+logger = logging.getLogger(__name__)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Returning the number of differing bits of two hashes."""
+    return (a ^ b).bit_count()
+
+
+# Creating the `BKTree` class
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with the Hamming distance as metric.
+
+    Every child edge is labelled with the distance to its parent, so a search
+    within radius `r` only descends into edges labelled `d - r` to `d + r`.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_value: int, value: Any) -> None:
+        """Adding a hash with its value, replacing the value of an identical hash."""
+        if self._root is None:
+            self._root = [hash_value, value, {}]
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, value, {}]
+                self._size += 1
+                return
+            node = child
+
+    def within(self, hash_value: int, max_distance: int) -> list[tuple[int, Any]]:
+        """Returning `(distance, value)` of every hash within `max_distance`, closest first."""
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+# Creating the `PerceptualHashIndex` class
+class PerceptualHashIndex:
+    """Near-duplicate index of image descriptions, persisted as JSON lines.
+
+    Entries are grouped by a context key (model and prompts), so a description
+    is only reused for the same backend and prompts it was generated with.
+    Images are looked up by the signature of `imaging.image_signature`. The
+    256-bit difference hash finds candidates in a BK-tree, and a candidate is
+    only reused if its pHash and aspect ratio agree as well. Images with little
+    detail, like text on a white slide, hash alike, so they are compared by the
+    content grid of their content box instead, among entries of about the same
+    content aspect ratio.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 16,
+        path: Optional[str] = None,
+        max_phash_distance: int = 8,
+        max_aspect_change: float = 0.02,
+        min_detail: float = 0.25,
+        max_content_distance: int = 48,
+        max_content_aspect_change: float = 0.03
+    ):
+        self.max_distance = max_distance
+        self.max_phash_distance = max_phash_distance
+        self.max_aspect_change = max_aspect_change
+        self.min_detail = min_detail
+        self.max_content_distance = max_content_distance
+        self.max_content_aspect_change = max_content_aspect_change
+        self._path = path
+        self._trees: dict[str, BKTree] = {}
+        self._contents: dict[str, list[tuple[float, int, dict]]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.reused = 0
+        self.rejected = 0
+        self.blank = 0
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        # Rebuilding the trees and content lists from the append-only file of a previous run
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                    if "content" in entry:
+                        self._insert_content(entry["context"], {
+                            "size": tuple(entry["content"]["size"]),
+                            "aspect": float(entry["content"]["aspect"]),
+                            "cells": base64.b64decode(entry["content"]["cells"]),
+                        }, entry["value"])
+                        continue
+                    self._tree(entry["context"]).add(int(entry["hash"], 16), {
+                        "phash": int(entry["phash"], 16),
+                        "aspect": float(entry["aspect"]),
+                        "value": entry["value"],
+                    })
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping unreadable perceptual hash entry: {e}")
+
+    def _tree(self, context: str) -> BKTree:
+        if context not in self._trees:
+            self._trees[context] = BKTree()
+        return self._trees[context]
+
+    def _insert_content(self, context: str, content: dict, value: Any) -> None:
+        # Keeping the low-detail entries of a context sorted by their content aspect ratio
+        entries = self._contents.setdefault(context, [])
+        bisect.insort(entries, (content["aspect"], len(entries), {"content": content, "value": value}))
+
+    def _low_detail(self, signature: dict) -> bool:
+        return signature["detail"] < self.min_detail
+
+    def _confirms(self, entry: dict, signature: dict) -> bool:
+        """Checking a candidate found by its difference hash against the pHash and aspect ratio."""
+        return (
+            hamming_distance(entry["phash"], signature["phash"]) <= self.max_phash_distance
+            and abs(entry["aspect"] / signature["aspect"] - 1) <= self.max_aspect_change
+        )
+
+    def _find_content(self, context: str, content: dict) -> Optional[Any]:
+        """Returning the value of the closest content grid within `max_content_distance`, or None."""
+        entries = self._contents.get(context, [])
+        low = bisect.bisect_left(entries, (content["aspect"] * (1 - self.max_content_aspect_change),))
+        high = bisect.bisect_right(entries, (content["aspect"] * (1 + self.max_content_aspect_change), len(entries)))
+        best = None
+        for _, _, entry in entries[low:high]:
+            distance = content_distance(content, entry["content"])
+            if distance > self.max_content_distance:
+                self.rejected += 1
+            elif best is None or distance < best[0]:
+                best = (distance, entry["value"])
+        return best[1] if best else None
+
+    def find(self, context: str, signature: dict) -> Optional[Any]:
+        """Returning the value of the nearest confirmed image within `max_distance`, or None."""
+        if self.max_distance < 0:
+            return None
+        with self._lock:
+            self.lookups += 1
+            if self._low_detail(signature):
+                if signature.get("content") is None:
+                    self.blank += 1
+                    return None
+                value = self._find_content(context, signature["content"])
+                if value is not None:
+                    self.reused += 1
+                return value
+            for _, entry in self._tree(context).within(signature["dhash"], self.max_distance):
+                if self._confirms(entry, signature):
+                    self.reused += 1
+                    return entry["value"]
+                self.rejected += 1
+            return None
+
+    def add(self, context: str, signature: dict, value: Any) -> None:
+        """Storing the value of an image under its signature, unless the image is blank."""
+        if self.max_distance < 0:
+            return
+        with self._lock:
+            if self._low_detail(signature):
+                content = signature.get("content")
+                if content is None:
+                    return
+                self._insert_content(context, content, value)
+                record = {
+                    "context": context,
+                    "content": {
+                        "size": list(content["size"]),
+                        "aspect": content["aspect"],
+                        "cells": base64.b64encode(content["cells"]).decode("ascii"),
+                    },
+                    "value": value,
+                }
+            else:
+                self._tree(context).add(signature["dhash"], {
+                    "phash": signature["phash"],
+                    "aspect": signature["aspect"],
+                    "value": value,
+                })
+                record = {
+                    "context": context,
+                    "hash": f"{signature['dhash']:064x}",
+                    "phash": f"{signature['phash']:016x}",
+                    "aspect": signature["aspect"],
+                    "value": value,
+                }
+            if not self._path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(self._path, "a", encoding="utf-8") as index_file:
+                    index_file.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logger.warning(f"Could not persist perceptual hash entry: {e}")
+
+    def stats(self) -> dict:
+        """Returning how many lookups were answered from near-duplicates."""
+        with self._lock:
+            return {
+                "entries": sum(len(tree) for tree in self._trees.values())
+                + sum(len(entries) for entries in self._contents.values()),
+                "max_distance": self.max_distance,
+                "lookups": self.lookups,
+                "blank": self.blank,
+                "rejected": self.rejected,
+                "llm_calls_avoided": self.reused,
+            }
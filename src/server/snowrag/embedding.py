@@ -55,6 +55,12 @@ class SnowflakeEmbeddings(BaseModel, Embeddings):
     model_kwargs: Optional[dict] = None
     """Other model keyword args"""
 
+    batch_size: int = 100
+    """Maximum number of texts embedded by one statement."""
+
+    max_batch_chars: int = 500_000
+    """Maximum number of characters bound to one statement, keeping it below Snowflake's statement size limit."""
+
 
 
     @property
@@ -84,21 +90,76 @@ class SnowflakeEmbeddings(BaseModel, Embeddings):
         finally:
             cursor.close()
 
+    def _process_emb_batch(self, input: List[str]) -> List[List[float]]:
+        """Embed many texts with a single statement over a bound VALUES list.
+
+        Args:
+            input: The strings to embed.
+
+        Returns:
+            The embeddings as lists of floats, in the order of `input`.
+        """
+        # Binding every text with its position, so the rows can be returned in input order
+        rows = ", ".join(["(?, ?)"] * len(input))
+        q = (
+            "SELECT t.IDX, SNOWFLAKE.CORTEX.EMBED_TEXT_1024(?, t.TXT) as EMBEDDING "
+            f"FROM (VALUES {rows}) AS t(IDX, TXT) ORDER BY t.IDX"
+        )
+        params = [self.model]
+        for index, text in enumerate(input):
+            params += [index, text]
+        cursor = self.connection.cursor(DictCursor)
+        try:
+            cursor.execute(q, params)
+            results = cursor.fetchall()
+        finally:
+            cursor.close()
+        if len(results) != len(input):
+            raise ValueError(f"Expected {len(input)} embeddings from Snowflake, got {len(results)}.")
+        return [result["EMBEDDING"] for result in results]
+
+    def _batches(self, input: List[str]) -> List[List[str]]:
+        """Split texts into batches within `batch_size` texts and `max_batch_chars` characters."""
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        chars = 0
+        for text in input:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
     def _embed(self, input: List[str]) -> List[List[float]]:
+        progress = None
         if self.show_progress:
             try:
                 from tqdm import tqdm
 
-                iter_ = tqdm(input, desc="SnowflakeEmbeddings")
+                progress = tqdm(total=len(input), desc="SnowflakeEmbeddings")
             except ImportError:
                 logger.warning(
                     "Unable to show progress bar because tqdm could not be imported. "
                     "Please install with `pip install tqdm`."
                 )
-                iter_ = input
+
+        # Embedding a single text with the plain statement and many texts batch by batch
+        if len(input) == 1:
+            embeddings = [self._process_emb_response(input[0])]
+            if progress is not None:
+                progress.update(1)
         else:
-            iter_ = input
-        return [self._process_emb_response(prompt) for prompt in iter_]
+            embeddings = []
+            for batch in self._batches(input):
+                embeddings += self._process_emb_batch(batch)
+                if progress is not None:
+                    progress.update(len(batch))
+        if progress is not None:
+            progress.close()
+        return embeddings
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed documents using Snowflake's embedding model.
@@ -0,0 +1,271 @@
+### `src/server/subscriptions.py`
+### Resource subscriptions and change notifications backed by a filesystem watcher
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import logging
+import os
+import weakref
+from typing import Any, Callable, Optional
+from mcp import types
+from mcp.server.session import ServerSession
+from .assets import ASSETS_DIR, AssetCache, assets
+from .config import secrets
+logger = logging.getLogger(__name__)
+
+# Setting how long file events are collected before notifying, editors write a file in several steps
+DEBOUNCE_SECONDS = 0.2
+
+# Setting the file events which change an asset, opening or reading it does not
+CHANGE_EVENTS = ("created", "modified", "closed", "deleted", "moved")
+LIST_EVENTS = ("created", "deleted", "moved")
+
+
+# Creating the `ResourceNotifier` class
+class ResourceNotifier:
+    """Tracking the resource subscriptions of client sessions and pushing change notifications.
+
+    Sessions are held weakly, so a closed session drops out on its own. A session
+    which fails to receive a notification is forgotten as well. Sessions which
+    listed resources receive `notifications/resources/list_changed`, sessions
+    which subscribed to a URI receive `notifications/resources/updated` for it.
+
+    Example:
+        .. code-block:: python
+
+            notifier.subscribe(session, "resource://Image.png")
+            await notifier.resources_updated(lambda uri: uri == "resource://Image.png")
+    """
+
+    def __init__(self):
+        self._subscriptions: weakref.WeakKeyDictionary[ServerSession, set[str]] = weakref.WeakKeyDictionary()
+        self._listeners: weakref.WeakSet[ServerSession] = weakref.WeakSet()
+        self.updates_sent = 0
+        self.list_changes_sent = 0
+        self.failed = 0
+
+    def subscribe(self, session: ServerSession, uri: str) -> None:
+        """Subscribing a session to the updates of a resource URI."""
+        self._subscriptions.setdefault(session, set()).add(uri)
+
+    def unsubscribe(self, session: ServerSession, uri: str) -> None:
+        """Removing the subscription of a session to a resource URI."""
+        uris = self._subscriptions.get(session)
+        if uris is not None:
+            uris.discard(uri)
+            if not uris:
+                del self._subscriptions[session]
+
+    def listen(self, session: ServerSession) -> None:
+        """Registering a session for changes of the resource list."""
+        self._listeners.add(session)
+
+    def _forget(self, session: ServerSession, error: Exception) -> None:
+        self.failed += 1
+        self._subscriptions.pop(session, None)
+        self._listeners.discard(session)
+        logger.info(f"Dropped resource subscriptions of a closed session: {error!r}")
+
+    async def resources_updated(self, matches: Callable[[str], bool]) -> int:
+        """Notifying every session subscribed to a URI for which `matches` is true.
+
+        Returns:
+            int: The number of notifications sent.
+        """
+        sent = 0
+        for session, uris in list(self._subscriptions.items()):
+            for uri in sorted(uri for uri in uris if matches(uri)):
+                try:
+                    await session.send_resource_updated(uri)
+                except Exception as e:
+                    self._forget(session, e)
+                    break
+                sent += 1
+        self.updates_sent += sent
+        return sent
+
+    async def resource_list_changed(self) -> int:
+        """Notifying every session which listed or subscribed to resources that the list changed.
+
+        Returns:
+            int: The number of notifications sent.
+        """
+        sent = 0
+        for session in set(self._listeners) | set(self._subscriptions.keys()):
+            try:
+                await session.send_resource_list_changed()
+            except Exception as e:
+                self._forget(session, e)
+                continue
+            sent += 1
+        self.list_changes_sent += sent
+        return sent
+
+    def stats(self) -> dict:
+        """Returning the subscribed sessions and URIs and the notifications sent."""
+        return {
+            "sessions": len(self._subscriptions),
+            "subscriptions": sum(len(uris) for uris in self._subscriptions.values()),
+            "listeners": len(self._listeners),
+            "updates_sent": self.updates_sent,
+            "list_changes_sent": self.list_changes_sent,
+            "failed": self.failed,
+        }
+
+
+def asset_uris(name: str) -> Callable[[str], bool]:
+    """Matching every resource URI served from an asset: the image, its renditions and its ETag."""
+    def matches(uri: str) -> bool:
+        return uri in (f"resource://{name}", f"etag://{name}") or uri.startswith(f"resource://{name}/")
+    return matches
+
+
+# Creating the `AssetWatcher` class
+class AssetWatcher:
+    """Watching the asset directory with inotify (through watchdog) and notifying subscribers.
+
+    Events arrive on the watchdog thread and are handed to the event loop, where
+    changes within `debounce` seconds are collected into one notification per
+    asset. Changed assets are dropped from the asset cache first, so a client
+    reading a resource right after its notification gets the new content.
+
+    Example:
+        .. code-block:: python
+
+            watcher = AssetWatcher(notifier)
+            watcher.start()
+            ...
+            await watcher.stop()
+    """
+
+    def __init__(
+        self,
+        notifier: ResourceNotifier,
+        cache: AssetCache = assets,
+        directory: str = ASSETS_DIR,
+        debounce: float = DEBOUNCE_SECONDS
+    ):
+        self._notifier = notifier
+        self._cache = cache
+        self._directory = directory
+        self._debounce = debounce
+        self._observer: Optional[Any] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: set[str] = set()
+        self._listing = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.events = 0
+
+    def start(self) -> None:
+        """Starting the watcher thread for the running event loop."""
+        if self._observer is not None:
+            return
+        from watchdog.observers import Observer
+        self._loop = asyncio.get_running_loop()
+        self._observer = Observer()
+        self._observer.schedule(self, self._directory, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        logger.info(f"Watching {self._directory} for resource changes.")
+
+    async def stop(self) -> None:
+        """Stopping the watcher thread and cancelling pending notifications."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._observer is not None:
+            self._observer.stop()
+            await asyncio.to_thread(self._observer.join, 5)
+            self._observer = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def dispatch(self, event: Any) -> None:
+        """Receiving a watchdog event on the watcher thread."""
+        if event.is_directory or event.event_type not in CHANGE_EVENTS:
+            return
+        names = {os.path.basename(os.fsdecode(event.src_path))}
+        if getattr(event, "dest_path", None):
+            names.add(os.path.basename(os.fsdecode(event.dest_path)))
+
+        # Skipping hidden and backup files of editors
+        names = {name for name in names if not name.startswith(".") and not name.endswith("~")}
+        if names and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed, names, event.event_type in LIST_EVENTS)
+
+    def _changed(self, names: set[str], listing: bool) -> None:
+        self.events += 1
+        self._pending |= names
+        self._listing = self._listing or listing
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self._debounce, self._flush)
+
+    def _flush(self) -> None:
+        names, listing = self._pending, self._listing
+        self._pending, self._listing, self._flush_handle = set(), False, None
+        for name in names:
+            self._cache.invalidate(name)
+        task = asyncio.create_task(self._notify(names, listing))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, names: set[str], listing: bool) -> None:
+        logger.info(f"Assets changed: {', '.join(sorted(names))}.")
+        for name in sorted(names):
+            await self._notifier.resources_updated(asset_uris(name))
+        if listing:
+            await self._notifier.resource_list_changed()
+
+
+def enable_subscriptions(mcp, registry: Optional[ResourceNotifier] = None) -> ResourceNotifier:
+    """Registering the resource subscribe and unsubscribe handlers of a FastMCP server.
+
+    Also advertises the `subscribe` and `listChanged` resource capabilities, which
+    the low-level server otherwise reports as unsupported, and registers every
+    session listing resources for list changes.
+    """
+    registry = registry or notifier
+    server = mcp._mcp_server
+
+    @server.subscribe_resource()
+    async def subscribe(uri) -> None:
+        registry.subscribe(server.request_context.session, str(uri))
+
+    @server.unsubscribe_resource()
+    async def unsubscribe(uri) -> None:
+        registry.unsubscribe(server.request_context.session, str(uri))
+
+    # Remembering the sessions which list resources, they are interested in list changes
+    for request_type in (types.ListResourcesRequest, types.ListResourceTemplatesRequest):
+        server.request_handlers[request_type] = _listening(
+            server, registry, server.request_handlers[request_type])
+
+    get_capabilities = server.get_capabilities
+
+    def _get_capabilities(notification_options, experimental_capabilities) -> types.ServerCapabilities:
+        capabilities = get_capabilities(notification_options, experimental_capabilities)
+        if capabilities.resources is not None:
+            capabilities.resources.subscribe = True
+            capabilities.resources.listChanged = True
+        return capabilities
+
+    server.get_capabilities = _get_capabilities
+    return registry
+
+
+def _listening(server, registry, handler):
+    async def wrapper(request: Any) -> Any:
+        registry.listen(server.request_context.session)
+        return await handler(request)
+    return wrapper
+
+
+def watch_assets() -> bool:
+    """Reading whether the asset directory is watched, `MCP_WATCH_ASSETS` defaults to true."""
+    return str(secrets.get("MCP", {}).get("MCP_WATCH_ASSETS", "True")).lower() == "true"
+
+
+# Creating the notifier and asset watcher shared by the server process
+notifier = ResourceNotifier()
+watcher = AssetWatcher(notifier)
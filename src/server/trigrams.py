@@ -0,0 +1,103 @@
+### `src/server/trigrams.py`
+### In-memory trigram index for fuzzy name searches
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Mapping
+
+# Setting the transliterations of German letters, so "Oesterreich" finds "Österreich"
+TRANSLITERATIONS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+# Setting the score bonus of names starting with the query, so "deutsch" ranks "Deutschland" first
+PREFIX_BONUS = 0.25
+
+
+def normalize_name(name: str) -> str:
+    """Lower-casing a name, dropping accents and collapsing everything but letters and digits to blanks."""
+    text = unicodedata.normalize("NFKD", name.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"[^0-9a-z]+", " ", text).strip()
+
+
+def name_keys(name: str) -> set[str]:
+    """Returning the search keys of a name, with and without transliterated umlauts."""
+    return {key for key in (normalize_name(name), normalize_name(name.casefold().translate(TRANSLITERATIONS))) if key}
+
+
+def trigrams(key: str) -> set[str]:
+    """Returning the trigrams of every word of a key, padded like PostgreSQL's pg_trgm."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+# Creating the `TrigramIndex` class
+class TrigramIndex:
+    """Ranking the names of a code to name mapping by trigram similarity to a query.
+
+    Every name is indexed once as written (without accents) and once with
+    transliterated umlauts. A search only scores the names sharing at least one
+    trigram with the query, found through the posting lists, so it runs in well
+    under a millisecond for a few hundred names. The score is the Jaccard
+    similarity of the trigram sets plus a bonus for names starting with the query.
+
+    Example:
+        .. code-block:: python
+
+            index = TrigramIndex({"DE": "Deutschland", "AT": "Österreich"})
+            index.search("Oesterreich")
+            # [{"code": "AT", "name": "Österreich", "score": 1.0}]
+    """
+
+    def __init__(self, names: Mapping[str, str]):
+        self._entries: list[tuple[str, str, str, int]] = []
+        self._postings: dict[str, list[int]] = defaultdict(list)
+        for code, name in names.items():
+            for key in name_keys(name):
+                grams = trigrams(key)
+                entry = len(self._entries)
+                self._entries.append((code, name, key, len(grams)))
+                for gram in grams:
+                    self._postings[gram].append(entry)
+
+    def __len__(self) -> int:
+        return len({entry[0] for entry in self._entries})
+
+    def search(self, query: str, limit: int = 5, threshold: float = 0.2) -> list[dict]:
+        """Returning the best matching names with their codes and scores, best first.
+
+        Args:
+            query: A full or partial name, misspellings included.
+            limit: The maximum number of matches.
+            threshold: The minimum score of a match.
+
+        Returns:
+            list[dict]: The `code`, `name` and `score` of every match, one per code.
+        """
+        best: dict[str, tuple[float, str]] = {}
+        for key in name_keys(query):
+            grams = trigrams(key)
+
+            # Counting the shared trigrams of every name found through the posting lists
+            shared: dict[int, int] = defaultdict(int)
+            for gram in grams:
+                for entry in self._postings.get(gram, ()):
+                    shared[entry] += 1
+            for entry, count in shared.items():
+                code, name, entry_key, size = self._entries[entry]
+                score = count / (len(grams) + size - count)
+                if entry_key == key:
+                    score = 1.0
+                elif entry_key.startswith(key):
+                    score = min(1.0, score + PREFIX_BONUS)
+                if score >= threshold and score > best.get(code, (0.0, ""))[0]:
+                    best[code] = (score, name)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[1][1]))
+        return [
+            {"code": code, "name": name, "score": round(score, 3)}
+            for code, (score, name) in ranked[:limit]
+        ]
@@ -0,0 +1,137 @@
+### `src/server/warmup.py`
+### Ollama model warm-up and keep-alive management for the MCP server
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import logging
+import time
+from typing import Optional, Union
+from .clients import clients
+from .config import LLM_LOCAL, secrets
+logger = logging.getLogger(__name__)
+
+# Setting the defaults for keeping the model resident and checking on it
+KEEP_ALIVE = "30m"
+RETRY_INTERVAL = 5.0
+CHECK_INTERVAL = 60.0
+
+
+def keep_alive() -> Union[float, str]:
+    """Reading how long Ollama keeps the model loaded after a request.
+
+    Durations like "30m" are passed through, plain numbers are seconds and a
+    negative number keeps the model loaded until Ollama stops.
+    """
+    value = secrets.get("OLLAMA", {}).get("OLLAMA_KEEP_ALIVE", KEEP_ALIVE)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _qualified(model: str) -> str:
+    """Adding the default tag, as Ollama reports loaded models with their tag."""
+    return model if ":" in model else f"{model}:latest"
+
+
+# Creating the `ModelWarmup` class
+class ModelWarmup:
+    """Pre-loading the Ollama model on server start and keeping it resident.
+
+    The model is loaded with an empty prompt, which makes Ollama read the weights
+    without generating anything. Afterwards `/api/ps` is checked periodically and
+    the model is loaded again if Ollama has evicted it or was restarted. The server
+    only reports ready while the model is loaded.
+
+    Example:
+        .. code-block:: python
+
+            warmup = ModelWarmup()
+            warmup.start()
+            ...
+            if warmup.ready:
+                ...
+            await warmup.stop()
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.loads = 0
+        self.load_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _model() -> str:
+        return secrets['OLLAMA']['OLLAMA_MODEL']
+
+    async def _is_loaded(self) -> bool:
+        """Checking whether Ollama currently holds the model in memory."""
+        model = _qualified(self._model())
+        processes = await clients.ollama().ps()
+        return any(_qualified(loaded.model or loaded.name or "") == model for loaded in processes.models)
+
+    async def _load(self) -> None:
+        """Loading the model and setting its keep-alive."""
+        start = time.perf_counter()
+        await clients.ollama().generate(model=self._model(), prompt="", keep_alive=keep_alive())
+        self.load_seconds = time.perf_counter() - start
+        self.loads += 1
+        logger.info(f"Warmed up Ollama model {self._model()} in {self.load_seconds:.1f}s.")
+
+    async def run(self) -> None:
+        """Keeping the model warm until cancelled."""
+        if not LLM_LOCAL:
+            # Azure OpenAI has no model to load, so the server is ready right away
+            self.ready = True
+            return
+
+        ollama_secrets = secrets.get("OLLAMA", {})
+        check_interval = float(ollama_secrets.get("OLLAMA_WARMUP_INTERVAL", CHECK_INTERVAL))
+        while True:
+            try:
+                if not self.ready or not await self._is_loaded():
+                    self.ready = False
+                    await self._load()
+                    self.ready = True
+                    self.last_error = None
+            except Exception as e:
+                self.ready = False
+                self.last_error = str(e)
+                logger.warning(f"Warming up Ollama model {self._model()} failed: {e}")
+                await asyncio.sleep(RETRY_INTERVAL)
+                continue
+            if check_interval <= 0:
+                return
+            await asyncio.sleep(check_interval)
+
+    def start(self) -> None:
+        """Starting the warm-up in the background of the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancelling the background warm-up."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.ready = False
+
+    def status(self) -> dict:
+        """Returning the readiness of the server and the state of the model."""
+        return {
+            "ready": self.ready,
+            "model": self._model() if LLM_LOCAL else None,
+            "keep_alive": keep_alive() if LLM_LOCAL else None,
+            "loads": self.loads,
+            "load_seconds": self.load_seconds,
+            "last_error": self.last_error,
+        }
+
+
+# Creating the warm-up shared by the server process
+warmup = ModelWarmup()
@@ -0,0 +1,65 @@
+### `src/server/workers.py`
+### Process pool for CPU-bound work of MCP server tools
+### Open-Source, hosted on https://github.com/DrBenjamin/BenBox
+### Please reach out to ben@seriousbenentertainment.org for any questions
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+from .config import secrets
+from .metrics import metrics
+logger = logging.getLogger(__name__)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Returning the shared process pool, or None if `MCP_PROCESS_WORKERS` is 0."""
+    global _process_pool
+    if _process_pool is None:
+        workers = int(secrets.get("MCP", {}).get(
+            "MCP_PROCESS_WORKERS", os.cpu_count() or 1))
+        if workers <= 0:
+            return None
+        # Starting workers from a fork server (spawn where missing), as forking the
+        # multi-threaded server would copy locks held by other threads into the workers
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        logger.info(f"Started process pool with {workers} workers.")
+    return _process_pool
+
+
+def _timed(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, float]:
+    """Running a function in a worker and returning its result with its running time."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+async def run_in_process(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Running a picklable function in the process pool without blocking the event loop.
+
+    Falls back to the default thread pool if the process pool is disabled. The
+    time spent waiting for a free worker and transferring the arguments and
+    result is added to the wait time of the calling handler.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    result, running = await loop.run_in_executor(
+        get_process_pool(), functools.partial(_timed, fn, *args, **kwargs))
+    metrics.add_wait(max(0.0, time.perf_counter() - start - running))
+    return result
+
+
+def shutdown_process_pool() -> None:
+    """Stopping the worker processes, cancelling work which has not started yet."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+        logger.info("Stopped process pool.")
@@ -0,0 +1,785 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from types import SimpleNamespace
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+# Adding the parent directory to sys.path to import the MCP server package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.server.cache import ResultCache
+
+
+def test_result_cache_memory_and_disk_tiers(tmp_path):
+    """Test that cached results survive a restart through the disk tier."""
+    key = ResultCache.make_key(b"image", "model", "system", "user")
+    cache = ResultCache(max_entries=2, directory=str(tmp_path))
+    assert cache.get(key) is None
+    cache.set(key, {"description": "A cat"})
+    assert cache.get(key) == {"description": "A cat"}
+
+    restarted = ResultCache(max_entries=2, directory=str(tmp_path))
+    assert restarted.get(key) == {"description": "A cat"}
+    assert restarted.get(key) == {"description": "A cat"}
+    assert cache.stats()["misses"] == 1
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["memory_hits"] == 1
+
+
+def test_result_cache_key_and_lru_eviction():
+    """Test that the key covers every part and the LRU evicts the oldest entry."""
+    assert ResultCache.make_key(b"image", "a") != ResultCache.make_key(b"image", "b")
+    cache = ResultCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_bk_tree_finds_hashes_within_distance():
+    """Test that the BK-tree returns the hashes inside the search radius only, closest first."""
+    from src.server.phash_index import BKTree
+    tree = BKTree()
+    tree.add(0b0000, "zero")
+    tree.add(0b0111, "three")
+    tree.add(0b1111, "four")
+    assert tree.within(0b0001, 1) == [(1, "zero")]
+    assert tree.within(0b1110, 1) == [(1, "four")]
+    assert tree.within(0b0110, 1) == [(1, "three")]
+    assert tree.within(0b0001, 2) == [(1, "zero"), (2, "three")]
+    assert tree.within(0b0011, 0) == []
+    assert len(tree) == 3
+
+
+def test_perceptual_hash_index_reuses_near_duplicates(tmp_path):
+    """Test that near-duplicates are reused per context and survive a restart."""
+    from src.server.phash_index import PerceptualHashIndex
+    path = str(tmp_path / "phash_index.jsonl")
+    index = PerceptualHashIndex(max_distance=2, path=path)
+    signature = {"dhash": 0xFF00, "phash": 0xF0, "aspect": 1.5, "detail": 0.6}
+    index.add("model-a", signature, "A slide")
+    assert index.find("model-a", {**signature, "dhash": 0xFF01}) == "A slide"
+    assert index.find("model-b", {**signature, "dhash": 0xFF01}) is None
+    assert index.find("model-a", {**signature, "dhash": 0xFF01, "aspect": 1.0}) is None
+    assert index.find("model-a", {**signature, "dhash": 0xFF01, "phash": 0xFFFF00F0}) is None
+
+    restarted = PerceptualHashIndex(max_distance=2, path=path)
+    assert restarted.find("model-a", {**signature, "dhash": 0xFF03}) == "A slide"
+    assert restarted.stats()["llm_calls_avoided"] == 1
+
+
+def test_perceptual_hash_index_tells_text_slides_apart():
+    """Test that different text-on-white slides never share a description while re-exports of one still do."""
+    from src.server.imaging import create_thumbnail
+    from src.server.phash_index import PerceptualHashIndex
+
+    def encode(img, image_format="PNG", **params):
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format, **params)
+        return buffer.getvalue()
+
+    def slide(*lines):
+        img = Image.new("RGB", (1280, 720), "white")
+        draw = ImageDraw.Draw(img)
+        for number, line in enumerate(lines):
+            draw.text((80, 80 + number * 70), line, fill="black", font=ImageFont.load_default(size=40))
+        return img
+
+    def signature(image_bytes):
+        return create_thumbnail(image_bytes, (400, 400), "PNG", 80, 0, True)[2]
+
+    lecture = slide("Lecture 1: Introduction", "Course goals")
+    index = PerceptualHashIndex()
+    index.add("model", signature(encode(lecture)), "Lecture 1")
+    assert signature(encode(lecture))["detail"] < index.min_detail
+    assert index.find("model", signature(encode(lecture, "JPEG", quality=40))) == "Lecture 1"
+    assert index.find("model", signature(encode(lecture.resize((768, 432))))) == "Lecture 1"
+    assert index.find("model", signature(encode(lecture.crop((40, 40, 1240, 680)), "JPEG", quality=60))) == "Lecture 1"
+    assert index.find("model", signature(encode(slide("Lecture 2: Introduction", "Course goals")))) is None
+    assert index.find("model", signature(encode(slide("Lecture 1: Introduction", "Course rules")))) is None
+    assert index.find("model", signature(encode(slide("Lecture 2: Sorting", "Quicksort and merge sort")))) is None
+    assert index.find("model", signature(encode(Image.new("RGB", (1280, 720), "white")))) is None
+    assert index.stats()["blank"] == 1
+
+    photo = Image.effect_mandelbrot((1280, 720), (-2, -1.2, 1, 1.2), 100).convert("RGB")
+    index.add("model", signature(encode(photo)), "A fractal")
+    assert index.find("model", signature(encode(photo, "JPEG", quality=40))) == "A fractal"
+    assert index.find("model", signature(encode(photo.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))) is None
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    """Test that identical concurrent calls run the backend once and share the result."""
+    from src.server.coalesce import SingleFlight, call_key
+    calls = []
+
+    async def backend():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "Deutschland"
+
+    async def run():
+        flight = SingleFlight()
+        key = call_key("get_country_name", {"country_code": "DE"})
+        results = await asyncio.gather(*(flight.do(key, backend) for _ in range(5)))
+        await flight.do(key, backend)
+        return results, flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["Deutschland"] * 5
+    assert len(calls) == 2
+    assert stats == {"calls": 2, "shared": 4, "in_flight": 0}
+
+
+def test_admit_image_checks_budgets_from_header_only():
+    """Test that oversized or unreadable images are rejected before any pixel decode."""
+    from src.server.imaging import admit_image, decode_reduced
+
+    def encode(img, image_format):
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    small = encode(Image.new("RGB", (40, 30)), "PNG")
+    assert admit_image(small, 10_000, 1, ("PNG",)) == {
+        "format": "PNG", "width": 40, "height": 30, "frames": 1}
+    with pytest.raises(ValueError, match="pixels exceed"):
+        admit_image(encode(Image.new("L", (200, 200)), "PNG"), 10_000, 1, ("PNG",))
+    with pytest.raises(ValueError, match="format"):
+        admit_image(small, 10_000, 1, ("JPEG",))
+    with pytest.raises(ValueError, match="not a readable image"):
+        admit_image(b"not an image", 10_000, 1, ("PNG",))
+
+    # Admitting oversized JPEGs which fit the budget at reduced decode scale
+    large_jpeg = encode(Image.new("RGB", (400, 400)), "JPEG")
+    assert admit_image(large_jpeg, 10_000, 1, ("JPEG",), "downscale")["width"] == 400
+
+    # Treating multi-picture files from phone cameras like JPEGs
+    buffer = io.BytesIO()
+    frames = [Image.new("RGB", (600, 600)), Image.new("RGB", (600, 600))]
+    frames[0].save(buffer, format="MPO", save_all=True, append_images=frames[1:])
+    assert admit_image(buffer.getvalue(), 10_000, 2, ("MPO",), "downscale")["format"] == "MPO"
+    assert decode_reduced(buffer.getvalue(), (50, 50)).size == (150, 150)
+
+
+def test_downscale_policy_lifts_pillow_pixel_limit_to_the_budget(monkeypatch):
+    """Test that JPEGs admitted at reduced scale are opened past Pillow's own decompression bomb limit."""
+    from src.server.imaging import admit_image, create_thumbnail, pixel_allowance
+
+    # Scaling Pillow's limit down, so a 1500 x 1500 JPEG stands in for one above 179 MP
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1_000_000)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1500, 1500), "white").save(buffer, format="JPEG")
+    large_jpeg = buffer.getvalue()
+    with pytest.raises(Image.DecompressionBombError):
+        create_thumbnail(large_jpeg, (100, 100))
+
+    # Admitting 2.25 MP at a budget of 35 200 (1/64 of the pixels is 35 156) but not of 35 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        assert admit_image(large_jpeg, 35_200, 1, ("JPEG",), "downscale")["width"] == 1500
+        thumbnail, mime_type = create_thumbnail(
+            large_jpeg, (100, 100), "PNG", max_pixels=pixel_allowance(35_200, "downscale"))
+    assert Image.open(io.BytesIO(thumbnail)).size == (100, 100)
+    with pytest.raises(ValueError, match="pixels exceed"):
+        admit_image(large_jpeg, 35_100, 1, ("JPEG",), "downscale")
+    with pytest.raises(ValueError, match="Image rejected"):
+        admit_image(large_jpeg, 35_200, 1, ("JPEG",))
+    assert Image.MAX_IMAGE_PIXELS == 1_000_000
+
+
+def test_thumbnail_settings_and_low_quality_budgets(monkeypatch):
+    """Test that low configured qualities still encode and unknown thumbnail formats are refused."""
+    from src.server import image_recognition
+    from src.server.imaging import create_thumbnail
+
+    buffer = io.BytesIO()
+    Image.effect_mandelbrot((300, 200), (-2, -1.2, 1, 1.2), 100).save(buffer, format="PNG")
+    thumbnail, mime_type = create_thumbnail(buffer.getvalue(), (100, 100), "JPEG", 20, 1)
+    assert mime_type == "image/jpeg" and thumbnail
+
+    monkeypatch.setattr(image_recognition, "secrets", {"MCP": {"MCP_THUMBNAIL_FORMAT": "gif"}})
+    with pytest.raises(ValueError, match="MCP_THUMBNAIL_FORMAT"):
+        image_recognition._thumbnail_settings()
+    monkeypatch.setattr(image_recognition, "secrets", {"MCP": {"MCP_THUMBNAIL_FORMAT": "auto"}})
+    assert image_recognition._thumbnail_settings()[1] == "AUTO"
+
+
+def test_captioning_retries_failed_keys_on_resume(tmp_path, monkeypatch):
+    """Test that failed images are kept in the checkpoint and retried instead of skipped by the next run."""
+    from src.server import captioning
+    keys = ["a.png", "b.png", "c.png"]
+    broken = {"b.png"}
+    written = []
+
+    async def recognize_image(image_bytes):
+        if image_bytes.decode() in broken:
+            raise ValueError("backend down")
+        return {"description": image_bytes.decode()}
+
+    class VectorStore:
+        def add_texts(self, texts, metadatas):
+            written.extend(texts)
+
+    monkeypatch.setattr(captioning, "secrets", {"MinIO": {"endpoint": "http://minio"}})
+    monkeypatch.setattr(captioning, "get_minio_client", lambda: None)
+    monkeypatch.setattr(captioning, "iter_objects", lambda client, bucket, prefix, start_after: iter(
+        [key for key in keys if start_after is None or key > start_after]))
+    monkeypatch.setattr(captioning, "get_object_bytes", lambda client, bucket, key, max_bytes: key.encode())
+    monkeypatch.setattr(captioning, "recognize_image", recognize_image)
+    path = str(tmp_path / "checkpoint.json")
+
+    first = asyncio.run(captioning.caption_bucket("bucket", VectorStore(), checkpoint_path=path))
+    assert first["last_key"] == "c.png" and first["failed_keys"] == ["b.png"] and first["failed"] == 1
+
+    broken.clear()
+    keys.append("d.png")
+    second = asyncio.run(captioning.caption_bucket("bucket", VectorStore(), checkpoint_path=path))
+    assert second["last_key"] == "d.png" and second["failed_keys"] == [] and second["failed"] == 0
+    assert sorted(written) == ["a.png: a.png", "b.png: b.png", "c.png: c.png", "d.png: d.png"]
+
+
+def test_load_secrets_merges_files_and_environment(tmp_path):
+    """Test that later files and environment variables override earlier values in a read-only mapping."""
+    from src.server.config import load_secrets
+
+    global_file = tmp_path / "global.toml"
+    global_file.write_text('LLM_LOCAL = "False"\n[OLLAMA]\nOLLAMA_MODEL = "llava"\nOLLAMA_URL = "http://a"\n')
+    project_file = tmp_path / "project.toml"
+    project_file.write_text('[OLLAMA]\nOLLAMA_URL = "http://b"\n[MinIO]\nbucket = "images"\n')
+
+    secrets = load_secrets(
+        [str(global_file), str(project_file), str(tmp_path / "missing.toml")],
+        {"LLM_LOCAL": "True", "OLLAMA_MODEL": "llama3.2-vision", "MINIO_ENDPOINT": "http://minio:9000"},
+    )
+    assert secrets["LLM_LOCAL"] == "True"
+    assert dict(secrets["OLLAMA"]) == {"OLLAMA_MODEL": "llama3.2-vision", "OLLAMA_URL": "http://b"}
+    assert dict(secrets["MinIO"]) == {"bucket": "images", "endpoint": "http://minio:9000"}
+    assert secrets.get("MCP", {}).get("MCP_CACHE_SIZE", 256) == 256
+    with pytest.raises(TypeError):
+        secrets["OLLAMA"]["OLLAMA_MODEL"] = "other"
+
+
+def test_tool_manifest_matches_tool_modules():
+    """Test that the manifest of lazily loaded tools matches the schemas of the tool modules."""
+    pytest.importorskip("mysql.connector")
+    pytest.importorskip("minio")
+    from src.server import mcp
+    from src.server.lazy_tools import LazyTool, build_manifest, load_manifest
+
+    assert build_manifest(mcp)["tools"] == load_manifest()
+    assert all(isinstance(tool, LazyTool) for tool in mcp._tool_manager.list_tools())
+
+
+def test_streamable_http_answers_initialize_on_mcp_path():
+    """Test that clients following the docs reach the streamable HTTP transport at `/mcp` without a trailing slash."""
+    from starlette.testclient import TestClient
+    from src.server import mcp
+    from src.server.asgi import create_starlette_app
+    initialize = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": "2025-03-26",
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "1.0"},
+        },
+    }
+    headers = {"Accept": "application/json, text/event-stream"}
+
+    with TestClient(create_starlette_app(mcp._mcp_server, transport="http", json_response=True)) as client:
+        response = client.post("/mcp", json=initialize, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["result"]["serverInfo"]["name"] == mcp.name
+        assert client.post("/mcp/", json=initialize, headers=headers).status_code == 200
+
+    with TestClient(create_starlette_app(mcp._mcp_server, transport="sse")) as client:
+        assert client.post("/mcp", json=initialize, headers=headers).status_code != 200
+    with pytest.raises(ValueError, match="Transport"):
+        create_starlette_app(mcp._mcp_server, transport="websocket")
+
+
+class FakeOllama:
+    """Stand-in for the Ollama client which loads models on `generate` and lists them on `ps`."""
+
+    def __init__(self, failures=0, release=None):
+        self.failures = failures
+        self.release = release
+        self.loaded = []
+        self.calls = 0
+
+    async def ps(self):
+        return SimpleNamespace(models=[SimpleNamespace(model=model, name=model) for model in self.loaded])
+
+    async def generate(self, model, prompt, keep_alive):
+        self.calls += 1
+        while self.release is not None and not self.release.is_set():
+            await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Connection refused")
+        self.loaded.append(f"{model}:latest")
+
+
+def _fake_ollama(monkeypatch, ollama):
+    """Pointing the warm-up at a fake Ollama which is checked once per run."""
+    from src.server import warmup as warmup_module
+    monkeypatch.setattr(warmup_module, "clients", SimpleNamespace(ollama=lambda: ollama))
+    monkeypatch.setattr(warmup_module, "LLM_LOCAL", True)
+    monkeypatch.setattr(warmup_module, "RETRY_INTERVAL", 0)
+    monkeypatch.setattr(warmup_module, "secrets", {
+        "OLLAMA": {"OLLAMA_MODEL": "llava", "OLLAMA_KEEP_ALIVE": "10m", "OLLAMA_WARMUP_INTERVAL": 0}})
+
+
+def test_model_warmup_becomes_ready_and_reloads_evicted_model(monkeypatch):
+    """Test that the warm-up reports ready once the model is loaded and loads it again after an eviction."""
+    from src.server.warmup import ModelWarmup
+    ollama = FakeOllama()
+    _fake_ollama(monkeypatch, ollama)
+    warmup = ModelWarmup()
+    assert warmup.status()["ready"] is False
+
+    asyncio.run(warmup.run())
+    status = warmup.status()
+    assert status["ready"] is True and status["loads"] == 1
+    assert status["model"] == "llava" and status["keep_alive"] == "10m"
+
+    # Skipping the load while Ollama still holds the model, loading it again once evicted
+    asyncio.run(warmup.run())
+    assert ollama.calls == 1
+    ollama.loaded.clear()
+    asyncio.run(warmup.run())
+    assert ollama.calls == 2 and warmup.ready and warmup.loads == 2
+
+
+def test_model_warmup_retries_until_ollama_answers(monkeypatch):
+    """Test that failed loads leave the server not ready with the error reported, until a retry succeeds."""
+    from src.server.warmup import ModelWarmup
+    ollama = FakeOllama(failures=2)
+    _fake_ollama(monkeypatch, ollama)
+    warmup = ModelWarmup()
+    states = []
+    generate = ollama.generate
+
+    async def observed_generate(**kwargs):
+        states.append((warmup.ready, warmup.last_error))
+        await generate(**kwargs)
+
+    ollama.generate = observed_generate
+    asyncio.run(warmup.run())
+    assert states == [(False, None), (False, "Connection refused"), (False, "Connection refused")]
+    assert warmup.ready and warmup.loads == 1 and warmup.last_error is None
+
+
+def test_ready_endpoint_answers_503_until_the_model_is_warm(monkeypatch):
+    """Test that `/ready` answers 503 while the model loads and 200 once the warm-up finished."""
+    from starlette.testclient import TestClient
+    from src.server import asgi, mcp
+    from src.server.warmup import ModelWarmup
+    release = threading.Event()
+    _fake_ollama(monkeypatch, FakeOllama(release=release))
+    monkeypatch.setattr(asgi, "warmup", ModelWarmup())
+
+    with TestClient(asgi.create_starlette_app(mcp._mcp_server, transport="http")) as client:
+        response = client.get("/ready")
+        assert response.status_code == 503 and response.json()["ready"] is False
+        release.set()
+        for _ in range(200):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.01)
+        assert response.status_code == 200
+        assert response.json()["ready"] is True and response.json()["loads"] == 1
+
+
+def test_metrics_split_backend_and_local_time():
+    """Test that handler calls, errors and backend time are rendered in the Prometheus text format."""
+    from src.server.metrics import Metrics
+
+    registry = Metrics()
+
+    async def describe(fail=False):
+        with registry.backend("ollama"):
+            await asyncio.sleep(0.02)
+        if fail:
+            raise ValueError("broken image")
+        return "A red square."
+
+    handler = registry.instrument("tool", "image_recognition", describe)
+    assert asyncio.run(handler()) == "A red square."
+    with pytest.raises(ValueError):
+        asyncio.run(handler(fail=True))
+
+    text = registry.render()
+    assert 'mcp_handler_calls_total{kind="tool",name="image_recognition"} 2' in text
+    assert 'mcp_handler_errors_total{kind="tool",name="image_recognition"} 1' in text
+    assert 'mcp_handler_in_flight{kind="tool",name="image_recognition"} 0' in text
+    assert 'mcp_backend_seconds_count{backend="ollama"} 2' in text
+    assert 'mcp_handler_seconds_bucket{kind="tool",name="image_recognition",part="backend",le="+Inf"} 2' in text
+    backend = registry.latency[("tool", "image_recognition", "backend")]
+    total = registry.latency[("tool", "image_recognition", "total")]
+    assert 0.04 <= backend.sum <= total.sum
+
+    # Reporting the time queued for admission as wait instead of local time
+    async def queued():
+        registry.queue_enter("tool", "queued")
+        await asyncio.sleep(0.03)
+        registry.queue_exit("tool", "queued", 0.03)
+
+    asyncio.run(registry.instrument("tool", "queued", queued)())
+    assert registry.latency[("tool", "queued", "wait")].sum == pytest.approx(0.03)
+    assert registry.latency[("tool", "queued", "local")].sum < 0.02
+
+
+def test_admission_limiter_rejects_when_queue_is_full():
+    """Test that calls beyond the concurrency and queue limits are rejected as busy."""
+    from src.server.admission import AdmissionLimiter, ServerBusyError
+    from src.server.metrics import Metrics
+
+    async def run():
+        registry = Metrics()
+        limiter = AdmissionLimiter("get_country_name", 1, 1, timeout=None, registry=registry)
+        release = asyncio.Event()
+
+        async def call():
+            async with limiter.slot():
+                await release.wait()
+                return "Deutschland"
+
+        running = asyncio.create_task(call())
+        queued = asyncio.create_task(call())
+        await asyncio.sleep(0)
+        assert (limiter.running, limiter.waiting) == (1, 1)
+        try:
+            await call()
+        except ServerBusyError as e:
+            rejected = str(e)
+        release.set()
+        return await asyncio.gather(running, queued), rejected, registry
+
+    results, rejected, registry = asyncio.run(run())
+    assert results == ["Deutschland", "Deutschland"]
+    assert "Server busy" in rejected
+    assert registry.rejected[("tool", "get_country_name")] == 1
+    assert registry.queue[("tool", "get_country_name")].count == 2
+
+
+def test_recognize_image_shares_one_llm_limiter_between_callers(monkeypatch):
+    """Test that concurrent recognitions from any caller keep to the shared LLM concurrency."""
+    from src.server import image_recognition
+    from src.server.admission import AdmissionLimiter
+    from src.server.phash_index import PerceptualHashIndex
+    peaks = []
+
+    async def create_thumbnail(image_bytes):
+        return "", "image/png", {}
+
+    async def describe(encoded, mime_type, on_token):
+        peaks.append(image_recognition._llm_limiter.running)
+        await asyncio.sleep(0.01)
+        return "An image."
+
+    monkeypatch.setattr(image_recognition, "secrets", {"MCP": {"MCP_SYSTEM_PROMPT": "s", "MCP_USER_PROMPT": "u"}})
+    monkeypatch.setattr(image_recognition, "_admit", lambda image_bytes: {})
+    monkeypatch.setattr(image_recognition, "_model_name", lambda: "model")
+    monkeypatch.setattr(image_recognition, "_create_thumbnail", create_thumbnail)
+    monkeypatch.setattr(image_recognition, "_describe_image", describe)
+    monkeypatch.setattr(image_recognition, "_cache", ResultCache(max_entries=16))
+    monkeypatch.setattr(image_recognition, "_phash_index", PerceptualHashIndex(max_distance=-1))
+
+    async def run():
+        monkeypatch.setattr(image_recognition, "_llm_limiter",
+                            AdmissionLimiter("llm", max_concurrency=2, max_queue=16, kind="backend"))
+        return await asyncio.gather(*(image_recognition.recognize_image(bytes([n])) for n in range(6)))
+
+    assert [result["description"] for result in asyncio.run(run())] == ["An image."] * 6
+    assert max(peaks) == 2
+
+
+def test_image_recognition_batch_bounds_concurrency_and_reports_item_errors(monkeypatch):
+    """Test that the batch tool keeps to its concurrency limit and returns failed items next to finished ones."""
+    from src.server import image_recognition
+    from src.server.admission import AdmissionLimiter
+    from src.server.phash_index import PerceptualHashIndex
+    running = []
+    peaks = []
+
+    def admit(image_bytes):
+        if image_bytes == b"broken":
+            raise ValueError("Image rejected: not a readable image.")
+        return {}
+
+    async def create_thumbnail(image_bytes):
+        return base64.b64encode(b"thumb" + image_bytes).decode("utf-8"), "image/png", {}
+
+    async def describe(encoded, mime_type, on_token):
+        running.append(1)
+        peaks.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return "An image."
+
+    monkeypatch.setattr(image_recognition, "secrets", {
+        "MCP": {"MCP_SYSTEM_PROMPT": "s", "MCP_USER_PROMPT": "u", "MCP_BATCH_CONCURRENCY": 3}})
+    monkeypatch.setattr(image_recognition, "_admit", admit)
+    monkeypatch.setattr(image_recognition, "_model_name", lambda: "model")
+    monkeypatch.setattr(image_recognition, "_create_thumbnail", create_thumbnail)
+    monkeypatch.setattr(image_recognition, "_describe_image", describe)
+    monkeypatch.setattr(image_recognition, "_phash_index", PerceptualHashIndex(max_distance=-1))
+    images = [base64.b64encode(bytes([n])).decode("utf-8") for n in range(8)]
+    images.insert(3, base64.b64encode(b"broken").decode("utf-8"))
+
+    def run(max_concurrency, include_thumbnails=True):
+        monkeypatch.setattr(image_recognition, "_cache", ResultCache(max_entries=16))
+        monkeypatch.setattr(image_recognition, "_llm_limiter",
+                            AdmissionLimiter("llm", max_concurrency=16, max_queue=16, kind="backend"))
+        peaks.clear()
+
+        async def batch():
+            return await image_recognition.image_recognition_batch(
+                images=images, max_concurrency=max_concurrency, include_thumbnails=include_thumbnails)
+        return asyncio.run(batch())
+
+    # Capping the requested concurrency at the server setting
+    content = run(5)
+    assert max(peaks) == 3
+    results = json.loads(content[0].text)["results"]
+    assert sorted(result["index"] for result in results) == list(range(9))
+    failed = [result for result in results if "error" in result]
+    assert failed == [{"index": 3, "source": "images[3]", "error": "Image rejected: not a readable image."}]
+    assert all("image_bytes" not in result for result in results)
+    assert [block.type for block in content[1:]] == ["image"] * 8
+    assert content[1].mimeType == "image/png"
+
+    # Leaving the thumbnails out on request
+    content = run(2, include_thumbnails=False)
+    assert max(peaks) == 2
+    assert len(content) == 1 and len(json.loads(content[0].text)["results"]) == 9
+
+
+def test_asset_cache_invalidates_on_change_and_resizes_once(tmp_path):
+    """Test that assets are read once per file version and renditions are cached with derived ETags."""
+    from src.server.assets import AssetCache
+    from src.server.workers import shutdown_process_pool
+
+    path = tmp_path / "Image.png"
+    Image.new("RGB", (64, 32), (255, 0, 0)).save(path)
+    cache = AssetCache(directory=str(tmp_path), revalidate=0)
+    first = cache.get("Image.png")
+    assert cache.get("Image.png") is first
+
+    rendition = asyncio.run(cache.rendition("Image.png", 16))
+    assert Image.open(io.BytesIO(rendition["content"])).size == (16, 8)
+    assert rendition["etag"] == cache.rendition_etag("Image.png", 16)
+    assert asyncio.run(cache.rendition("Image.png", 16)) is rendition
+    shutdown_process_pool()
+
+    Image.new("RGB", (64, 32), (0, 0, 255)).save(path)
+    os.utime(path, ns=(first["version"][0] + 10**9, first["version"][0] + 10**9))
+    assert cache.get("Image.png")["etag"] != first["etag"]
+    stats = cache.stats()
+    assert (stats["misses"], stats["resizes"], stats["renditions"]) == (3, 1, 0)
+    with pytest.raises(ValueError, match="asset directory"):
+        cache.get("../secrets.toml")
+
+
+def test_resized_image_resource_serves_the_declared_mime_type(tmp_path, monkeypatch):
+    """Test that `resource://{image}/{width}` encodes renditions of JPEGs as PNG, while `/assets` keeps JPEG."""
+    from src.server import get_variable_image, mcp
+    from src.server.assets import AssetCache
+    from src.server.workers import shutdown_process_pool
+
+    Image.effect_mandelbrot((64, 32), (-2, -1.2, 1, 1.2), 100).convert("RGB").save(tmp_path / "Photo.jpg")
+    cache = AssetCache(directory=str(tmp_path), revalidate=0)
+    monkeypatch.setattr(get_variable_image, "assets", cache)
+
+    contents = list(asyncio.run(mcp.read_resource("resource://Photo.jpg/16")))
+    rendition = Image.open(io.BytesIO(base64.b64decode(contents[0].content)))
+    assert contents[0].mime_type == "image/png"
+    assert (rendition.format, rendition.size) == ("PNG", (16, 8))
+
+    jpeg = asyncio.run(cache.rendition("Photo.jpg", 16))
+    assert jpeg["mime_type"] == "image/jpeg"
+    assert jpeg["etag"] == cache.rendition_etag("Photo.jpg", 16) != cache.rendition_etag("Photo.jpg", 16, "PNG")
+    shutdown_process_pool()
+
+
+def test_resource_notifier_pushes_to_subscribed_sessions():
+    """Test that updates reach subscribed sessions only and closed sessions are dropped."""
+    from src.server.subscriptions import ResourceNotifier, asset_uris
+
+    class Session:
+        def __init__(self, closed=False):
+            self.closed = closed
+            self.received = []
+
+        async def send_resource_updated(self, uri):
+            if self.closed:
+                raise ConnectionError("closed")
+            self.received.append(uri)
+
+        async def send_resource_list_changed(self):
+            self.received.append("list_changed")
+
+    registry = ResourceNotifier()
+    subscribed, listing, closed = Session(), Session(), Session(closed=True)
+    registry.subscribe(subscribed, "resource://Image.png/200")
+    registry.subscribe(subscribed, "resource://Image2.png")
+    registry.subscribe(closed, "etag://Image.png")
+    registry.listen(listing)
+
+    assert asyncio.run(registry.resources_updated(asset_uris("Image.png"))) == 1
+    assert asyncio.run(registry.resource_list_changed()) == 2
+    assert subscribed.received == ["resource://Image.png/200", "list_changed"]
+    assert listing.received == ["list_changed"]
+    assert registry.stats()["sessions"] == 1 and registry.stats()["failed"] == 1
+
+
+def test_database_pool_pings_idle_and_recycles_old_connections(monkeypatch):
+    """Test that queries run on the database threads and stale connections are checked before use."""
+    from src.server.database import DatabasePool
+
+    class Connection:
+        def __init__(self):
+            self._cnx = self
+            self.calls = []
+
+        def ping(self, **kwargs):
+            self.calls.append("ping")
+
+        def reconnect(self, **kwargs):
+            self.calls.append("reconnect")
+
+        def cursor(self, dictionary=False):
+            connection = self
+
+            class Cursor:
+                def execute(self, sql, params):
+                    connection.calls.append(threading.current_thread().name.split("_")[0])
+
+                def fetchall(self):
+                    return [{"ShortName de": "Deutschland"}]
+
+                def close(self):
+                    pass
+            return Cursor()
+
+        def close(self):
+            pass
+
+    connection = Connection()
+    pool = DatabasePool()
+    pool._pool = type("Pool", (), {"get_connection": lambda self: connection, "pool_size": 1})()
+    settings = {"pool_size": 1, "recycle": 60.0, "ping_interval": 10.0}
+    monkeypatch.setattr(DatabasePool, "_settings", staticmethod(lambda: settings))
+
+    async def lookups():
+        rows = await pool.query("SELECT 1")
+        pool._used[id(connection)] -= 20.0
+        await pool.query("SELECT 1")
+        pool._created[id(connection)] -= 100.0
+        return rows, await pool.query("SELECT 1")
+
+    assert asyncio.run(lookups())[0] == [{"ShortName de": "Deutschland"}]
+    assert connection.calls == ["mysql", "ping", "mysql", "reconnect", "mysql"]
+    assert pool.stats() == {"created": True, "pool_size": 1, "pings": 1, "recycles": 1}
+    pool._pool = None
+    pool.close()
+
+
+def test_country_table_serves_from_memory_and_falls_back_on_miss():
+    """Test that loaded codes need no query and unknown codes are queried once per refresh."""
+    from src.server.countries import CountryTable
+
+    class Database:
+        def __init__(self):
+            self.queries = []
+
+        async def query(self, sql, params=()):
+            self.queries.append(params)
+            if not params:
+                return [{"CODE": "DE", "ShortName de": "Deutschland"}, {"CODE": "AT", "ShortName de": "Österreich"}]
+            return [{"ShortName de": "Malawi"}] if params == ("MW",) else []
+
+    db = Database()
+    table = CountryTable(db)
+
+    async def lookups():
+        assert await table.refresh() == 2
+        return [await table.lookup(code) for code in ("de", " AT ", "MW", "MW", "XX", "XX")]
+
+    assert asyncio.run(lookups()) == ["Deutschland", "Österreich", "Malawi", "Malawi", None, None]
+    assert db.queries == [(), ("MW",), ("XX",)]
+    assert table.stats()["db_lookups"] == 2 and table.stats()["hits"] == 3
+
+    db.queries.clear()
+    names = asyncio.run(table.lookup_many(["DE", "MW", "XX", "CH", "FR", "DE"]))
+    assert names == {"DE": "Deutschland", "MW": "Malawi", "XX": None, "CH": None, "FR": None}
+    assert db.queries == [["CH", "FR"]]
+
+
+def test_trigram_index_ranks_misspelled_and_partial_names():
+    """Test that the name search tolerates umlaut spellings, typos and prefixes."""
+    from src.server.trigrams import TrigramIndex
+
+    index = TrigramIndex({
+        "DE": "Deutschland", "AT": "Österreich", "FR": "Frankreich",
+        "US": "Vereinigte Staaten", "GB": "Vereinigtes Königreich", "ML": "Mali", "MW": "Malawi",
+    })
+    assert index.search("Oesterreich")[0] == {"code": "AT", "name": "Österreich", "score": 1.0}
+    assert index.search("osterreich", limit=1)[0]["code"] == "AT"
+    assert index.search("deutsch")[0]["code"] == "DE"
+    assert [match["code"] for match in index.search("Vereinigte Staten", limit=2)] == ["US", "GB"]
+    assert [match["code"] for match in index.search("Mali")] == ["ML", "MW"]
+    assert index.search("xyz") == [] and len(index) == 7
+
+
+def test_snowflake_embeddings_batch_texts_into_few_statements():
+    """Test that many texts are embedded with one VALUES statement per batch, in input order."""
+    pytest.importorskip("snowflake.connector")
+    pytest.importorskip("langchain_core")
+    from src.server.snowrag.embedding import SnowflakeEmbeddings
+
+    class Connection:
+        def __init__(self):
+            self.statements = []
+
+        def cursor(self, cursor_class=None):
+            connection = self
+
+            class Cursor:
+                def execute(self, query, params):
+                    connection.statements.append((query, params))
+                    self.rows = [
+                        {"IDX": index, "EMBEDDING": [float(len(text))]}
+                        for index, text in zip(params[1::2], params[2::2])
+                    ]
+
+                def fetchall(self):
+                    return self.rows
+
+                def fetchone(self):
+                    return {"EMBEDDING": [float(len(connection.statements[-1][1][1]))]}
+
+                def close(self):
+                    pass
+            return Cursor()
+
+    connection = Connection()
+    embeddings = SnowflakeEmbeddings.model_construct(
+        connection=connection, model="multilingual-e5-large", batch_size=2, max_batch_chars=100)
+    texts = ["a", "bb", "ccc", "d" * 99, "e"]
+    assert embeddings.embed_documents(texts) == [[1.0], [2.0], [3.0], [99.0], [1.0]]
+    assert [len(params) for _, params in connection.statements] == [5, 3, 5]
+    assert "FROM (VALUES (?, ?), (?, ?))" in connection.statements[0][0]
+    assert embeddings.embed_query("query") == [5.0]